@@ -0,0 +1,90 @@
+"""Run cluster nodes with fake shards and check action forwarding.
+
+Each process generates synthetic actions for random users, handles the ones it
+owns and forwards the rest over the real ClusterLink IPC. Prints a JSON report
+per node and fails if any node received an action for a user it doesn't own.
+
+    python -m benchmarks.cluster --clusters 4 --events 200000
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import tempfile
+import time
+
+from go_outside.cluster import ACTION, ClusterLink
+
+
+async def fake_node(index: int, args, socket_dir: str, results) -> None:
+    link = ClusterLink(index, args.clusters, socket_dir)
+    stats = {"node": index, "local": 0, "received": 0, "misrouted": 0}
+
+    def handler(kind, user_id, action, ts, points):
+        if kind != ACTION:
+            return
+        stats["received"] += 1
+        if not link.owns(user_id):
+            stats["misrouted"] += 1
+
+    await link.start(handler)
+    # wait for the other nodes to come up
+    await asyncio.sleep(args.startup_delay)
+
+    rng = random.Random(index)
+    started = time.perf_counter()
+    for i in range(args.events):
+        user_id = rng.getrandbits(63)
+        if link.owns(user_id):
+            stats["local"] += 1
+        else:
+            link.forward_action(user_id, 0, int(time.time()))
+        if i % 1000 == 0:
+            await asyncio.sleep(0)
+    stats["seconds"] = round(time.perf_counter() - started, 4)
+    stats["forwarded"] = link.forwarded
+
+    # let everyone finish sending before shutting down
+    await asyncio.sleep(args.drain_delay)
+    await link.close()
+    results.put(stats)
+
+
+def run_fake_node(index: int, args, socket_dir: str, results):
+    asyncio.run(fake_node(index, args, socket_dir, results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--clusters", type=int, default=2)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--startup-delay", type=float, default=1)
+    parser.add_argument("--drain-delay", type=float, default=2)
+    args = parser.parse_args()
+
+    socket_dir = tempfile.mkdtemp(prefix="go-outside-")
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=run_fake_node, args=(i, args, socket_dir, results)
+        )
+        for i in range(args.clusters)
+    ]
+    for process in processes:
+        process.start()
+    report = sorted((results.get() for _ in processes), key=lambda r: r["node"])
+    for process in processes:
+        process.join()
+
+    forwarded = sum(r["forwarded"] for r in report)
+    received = sum(r["received"] for r in report)
+    summary = {"nodes": report, "forwarded": forwarded, "received": received}
+    print(json.dumps(summary, indent=2))
+    if received != forwarded or any(r["misrouted"] for r in report):
+        raise SystemExit("actions were lost or misrouted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Schedule milestone timers for many users and check they fire on time.
+
+Adds one timer per user at a random time over the next few days, then steps the
+timer wheel through that period a second at a time, like the milestone loop
+does. Prints a JSON report and fails if any timer fires late, early or not at all.
+
+    python -m benchmarks.milestones --users 1000000 --days 7 --memory
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from go_outside.utils.timers import TimerWheel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--memory", action="store_true", help="also measure the wheel's memory use"
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = int(time.time())
+    horizon = int(args.days * 86400)
+    dues = [
+        (rng.getrandbits(63), start + rng.randrange(1, horizon))
+        for _ in range(args.users)
+    ]
+
+    memory = None
+    if args.memory:
+        # tracing slows allocation down a lot, so measure on a separate wheel
+        tracemalloc.start()
+        traced = TimerWheel(start)
+        for user_id, due in dues:
+            traced.add(user_id, due)
+        memory = round(tracemalloc.get_traced_memory()[0] / 2**20, 1)
+        tracemalloc.stop()
+        del traced
+
+    wheel = TimerWheel(start)
+    started = time.perf_counter()
+    for user_id, due in dues:
+        wheel.add(user_id, due)
+    add_seconds = time.perf_counter() - started
+
+    fired = late = 0
+    busiest = 0
+    started = time.perf_counter()
+    for now in range(start + 1, start + horizon + 1):
+        batch = wheel.advance(now)
+        fired += len(batch)
+        late += sum(due != now for _, due in batch)
+        busiest = max(busiest, len(batch))
+    advance_seconds = time.perf_counter() - started
+
+    report = {
+        "users": args.users,
+        "simulated_seconds": horizon,
+        "add_seconds": round(add_seconds, 3),
+        "adds_per_second": round(args.users / add_seconds),
+        "wheel_memory_mb": memory,
+        "advance_seconds": round(advance_seconds, 3),
+        "advance_us_per_tick": round(advance_seconds / horizon * 1e6, 2),
+        "fired": fired,
+        "fired_off_time": late,
+        "max_fired_per_tick": busiest,
+    }
+    print(json.dumps(report, indent=2))
+    if fired != args.users or late or len(wheel):
+        raise SystemExit("timers were lost or fired at the wrong time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Drive the outbound message scheduler against a fake HTTP layer.
+
+Queues a burst of notifications and replies across a few channels, sends them
+through a fake sender with simulated latency, and prints a JSON report. Fails
+if any channel got more messages than its rate limit allows.
+
+    python -m benchmarks.outbound --channels 5 --notifications 500 --replies 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from go_outside.settings import Settings
+from go_outside.utils.outbound import MessageScheduler
+
+
+class FakeHTTP:
+    """Records sends instead of talking to Discord."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent: list[tuple[float, int, str]] = []  # (time, channel_id, content)
+
+    async def send(self, channel_id: int, content: str | None, kwargs: dict):
+        self.sent.append((time.monotonic(), channel_id, content))
+        await asyncio.sleep(self.latency)
+        return len(self.sent)
+
+
+def max_in_window(times: list[float], window: float) -> int:
+    """Most sends that fall within any `window` seconds."""
+    best = 0
+    start = 0
+    for end in range(len(times)):
+        while times[end] - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def run(args) -> dict:
+    http = FakeHTTP(args.latency)
+    scheduler = MessageScheduler(http.send)
+    scheduler.start()
+    rng = random.Random(0)
+    channels = list(range(1, args.channels + 1))
+
+    for i in range(args.notifications):
+        scheduler.notify(rng.choice(channels), f"notification {i}")
+
+    async def reply(i: int) -> float:
+        await asyncio.sleep(rng.random() * args.duration)
+        start = time.monotonic()
+        await scheduler.send(rng.choice(channels), f"reply {i}")
+        return time.monotonic() - start
+
+    latencies = await asyncio.gather(*(reply(i) for i in range(args.replies)))
+    # wait for the notifications to drain
+    while scheduler.channels or scheduler.sends:
+        await asyncio.sleep(0.05)
+    await scheduler.close()
+
+    period = Settings.Outbound.channel_period
+    per_channel = {
+        channel_id: max_in_window(
+            [t for t, c, _ in http.sent if c == channel_id], period
+        )
+        for channel_id in channels
+    }
+    delivered = sum(
+        content.count("\n") + 1
+        for _, _, content in http.sent
+        if content.startswith("notification")
+    )
+    return {
+        "messages_sent": len(http.sent),
+        "notifications_delivered": delivered,
+        "notifications_merged": scheduler.merged.value,
+        "reply_latency_p50": round(statistics.median(latencies), 4),
+        "reply_latency_max": round(max(latencies), 4),
+        "max_per_channel_window": max(per_channel.values()),
+        "channel_limit": Settings.Outbound.channel_messages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--notifications", type=int, default=500)
+    parser.add_argument("--replies", type=int, default=20)
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10,
+        help="spread replies over this many seconds",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="simulated HTTP latency"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if report["max_per_channel_window"] > report["channel_limit"]:
+        raise SystemExit("channel rate limit exceeded")
+    if report["notifications_delivered"] != args.notifications:
+        raise SystemExit("notifications were lost")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Replay gateway events into the Leveling cog and measure throughput.
+
+Builds GoOutside with the real leveling cog against an in-memory SQLite
+database, feeds synthetic (or recorded) events straight into the cog's
+listeners, and prints a JSON report.
+
+    python -m benchmarks.replay --users 10000 --events 200000
+    python -m benchmarks.replay --input events.ndjson --output report.json
+
+Recorded streams are NDJSON, one event per line:
+    {"type": "message", "user_id": 123, "ts": 1700000000.0}
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from tortoise import Tortoise, connections
+
+from go_outside.bot import GoOutside
+from go_outside.settings import Settings
+from go_outside.utils import db
+from go_outside.utils.events import DISCORD_EPOCH
+from go_outside.utils.state import action_id
+
+EVENT_TYPES = ["message", "message_edit", "reaction_add", "typing", "voice", "presence"]
+# rough mix of what a busy guild sends
+EVENT_WEIGHTS = [10, 1, 4, 10, 1, 20]
+
+# every synthetic event comes from this guild
+GUILD = SimpleNamespace(id=1)
+
+QUERY_METHODS = (
+    "execute_query",
+    "execute_query_dict",
+    "execute_insert",
+    "execute_many",
+    "execute_script",
+)
+
+
+class QueryCounter:
+    """Counts queries sent through a Tortoise connection."""
+
+    def __init__(self, conn):
+        self.count = 0
+        for name in QUERY_METHODS:
+            setattr(conn, name, self.wrap(getattr(conn, name)))
+
+    def wrap(self, method):
+        async def counted(*args, **kwargs):
+            self.count += 1
+            return await method(*args, **kwargs)
+
+        return counted
+
+
+def synthetic_events(users: int, events: int, seed: int):
+    """Generate events from `users` users, starting at the current time."""
+    rng = random.Random(seed)
+    ts = time.time()
+    for _ in range(events):
+        ts += rng.expovariate(100)
+        yield {
+            "type": rng.choices(EVENT_TYPES, EVENT_WEIGHTS)[0],
+            "user_id": rng.randrange(users),
+            "ts": ts,
+        }
+
+
+def recorded_events(path: str):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def dispatch(cog, members: dict, event: dict):
+    """Build fake gateway payloads for an event and return the listener coroutine."""
+    user_id = event["user_id"]
+    member = members.get(user_id)
+    if member is None:
+        member = members[user_id] = SimpleNamespace(
+            id=user_id, bot=False, name=str(user_id), guild=GUILD
+        )
+    when = datetime.datetime.fromtimestamp(event["ts"], datetime.timezone.utc)
+    kind = event["type"]
+    if kind == "message":
+        snowflake = (int(event["ts"] * 1000) - DISCORD_EPOCH) << 22
+        return cog.on_message(
+            SimpleNamespace(author=member, id=snowflake, guild=GUILD)
+        )
+    if kind == "message_edit":
+        data = {"author": {"id": str(user_id)}, "edited_timestamp": when.isoformat()}
+        return cog.on_raw_message_edit(SimpleNamespace(data=data, guild_id=GUILD.id))
+    if kind == "reaction_add":
+        return cog.on_raw_reaction_add(
+            SimpleNamespace(user_id=user_id, guild_id=GUILD.id)
+        )
+    if kind == "typing":
+        return cog.on_raw_typing(
+            SimpleNamespace(user_id=user_id, timestamp=when, guild_id=GUILD.id)
+        )
+    if kind == "voice":
+        return cog.on_voice_state_update(member, None, None)
+    if kind == "presence":
+        return cog.on_presence_update(member, member)
+    raise ValueError(f"unknown event type {kind}")
+
+
+def percentile(samples: list[int], p: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+
+
+async def run(args) -> dict:
+    Settings.Leveling.coalesce_window = args.window
+    Settings.Database.batch_update_interval = args.flush_interval
+    # milestone DMs would need a real connection
+    Settings.Leveling.milestone_notifications = False
+
+    bot = GoOutside(token="", db_url=args.db_url)
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["go_outside.utils.db"]})
+    await Tortoise.generate_schemas()
+
+    # register a fraction of the user IDs
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    registered = [i for i in range(args.users) if rng.random() < args.registered]
+    await db.User.bulk_create(
+        [
+            db.User(
+                user_id=i,
+                last_action_type="message_create",
+                last_action_timestamp=now,
+                personal_best=0,
+                points=0,
+            )
+            for i in registered
+        ],
+        batch_size=1000,
+    )
+    await db.load_users()
+    if args.counted:
+        counted = {action_id(name) for name in args.counted}
+        db.event_masks[GUILD.id] = sum(1 << action for action in counted)
+
+    bot.load_cogs(["go_outside.cogs.leveling"])
+    cog = bot.get_cog("Leveling")
+    await cog.setup()
+    db.start_flusher()
+
+    flush_sizes = []
+    batch_update_users = db.batch_update_users
+
+    async def recorded_batch_update():
+        if db.UserCache.batch_update_records:
+            flush_sizes.append(len(db.UserCache.batch_update_records))
+        await batch_update_users()
+
+    db.batch_update_users = recorded_batch_update
+    queries = QueryCounter(connections.get("default"))
+
+    if args.input:
+        events = recorded_events(args.input)
+    else:
+        events = synthetic_events(args.users, args.events, args.seed)
+
+    members = {}
+    latencies = []
+    count = 0
+    started = time.perf_counter()
+    for event in events:
+        coro = dispatch(cog, members, event)
+        t = time.perf_counter_ns()
+        await coro
+        latencies.append(time.perf_counter_ns() - t)
+        count += 1
+        # let the worker and flusher run, like the gateway would between events
+        if count % args.yield_every == 0:
+            await asyncio.sleep(0)
+    ingested = time.perf_counter() - started
+
+    await cog.cleanup()
+    await db.stop_flusher()
+    elapsed = time.perf_counter() - started
+    await Tortoise.close_connections()
+
+    latencies.sort()
+    return {
+        "events": count,
+        "users": args.users,
+        "registered_users": len(registered),
+        "ingest_seconds": round(ingested, 4),
+        "total_seconds": round(elapsed, 4),
+        "events_per_second": round(count / elapsed, 1) if elapsed else None,
+        "process_action_us": {
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "mean": statistics.fmean(latencies) / 1000 if latencies else 0,
+        },
+        "queries": queries.count,
+        "queries_per_event": queries.count / count if count else 0,
+        "events_dropped": cog.events_dropped,
+        "users_updated": cog.users_updated,
+        "coalescing_ratio": round(cog.coalescing_ratio, 3),
+        "flush_sizes": flush_sizes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--registered", type=float, default=0.1)
+    parser.add_argument(
+        "--counted",
+        nargs="+",
+        metavar="ACTION",
+        help="event types the guild counts, e.g. message_create voice_state_update "
+        "(default: all)",
+    )
+    parser.add_argument("--input", help="NDJSON file of recorded events")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--window", type=float, default=0.05)
+    parser.add_argument("--flush-interval", type=float, default=1)
+    parser.add_argument("--yield-every", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,73 @@
+import argparse
+import asyncio
 import os
 
 import dotenv
 
+from . import cluster
 from .bot import GoOutside
 from .settings import Settings
+from .utils import backup
 
 
 def main():
+    parser = argparse.ArgumentParser(prog="go_outside")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="run",
+        choices=["run", "export", "import"],
+        help="run the bot (default), or dump/restore the database",
+    )
+    parser.add_argument("path", nargs="?", help="dump file for export/import")
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=1,
+        help="run shard groups in this many processes",
+    )
+    parser.add_argument(
+        "--shards", type=int, help="total shard count (cluster mode only)"
+    )
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        help="minimal intents, no member/presence caching",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="log how long each startup phase takes "
+        "(combine with python -X importtime for per-module import times)",
+    )
+    args = parser.parse_args()
+    Settings.lean_mode = args.lean
+    Settings.profile_startup = args.profile_startup
+
     dotenv.load_dotenv(override=True)
     token = os.getenv("BOT_TOKEN")
     db_url = os.getenv("DB_URL")
+    # optional, read-only queries go here if set
+    replica_url = os.getenv("DB_REPLICA_URL")
+
+    if args.command != "run":
+        if not args.path:
+            parser.error(f"{args.command} needs a path")
+        asyncio.run(backup.run(args.command, db_url, args.path))
+        return
+
+    if args.clusters > 1:
+        cluster.run_cluster(
+            token,
+            db_url,
+            replica_url,
+            args.clusters,
+            args.shards or args.clusters,
+            args.lean,
+        )
+        return
 
-    bot = GoOutside(token, db_url)
+    bot = GoOutside(token, db_url, replica_url)
     bot.run()
 
 
@@ -1,49 +1,104 @@
 import asyncio
+import contextlib
 import datetime
+import importlib
 import signal
+import time
 
 import disnake
 from disnake.ext import commands
 from loguru import logger
 
+from go_outside import cluster
 from go_outside.settings import Settings
-from go_outside.utils import db
+from go_outside.utils import db, metrics
+from go_outside.utils.outbound import MessageScheduler
 
 
-async def prefix(bot: "GoOutside", message: disnake.Message, only_guild_prefix=False):
+def prefix(bot: "GoOutside", message: disnake.Message, only_guild_prefix=False):
     """Get the prefix(es) for a guild. This is used by the bot internally,
-    but can be called with only_guild_prefixes=True to remove mention prefix."""
-    default = Settings.prefix
-    if not message.guild:
-        return commands.when_mentioned(bot, message) + [default]
-    config = await db.get_config(message.guild.id)
-    if config:
-        p = config.prefix
+    but can be called with only_guild_prefixes=True to remove mention prefix.
+    Prefixes are read from the preloaded prefix map, this never awaits."""
+    if message.guild:
+        p = db.prefixes.get(message.guild.id, Settings.prefix)
     else:
-        p = default
+        p = Settings.prefix
     if only_guild_prefix:
         return p
-    else:
-        return commands.when_mentioned(bot, message) + [p]
+    prefixes = bot.prefix_lists.get(p)
+    if prefixes is None:
+        prefixes = bot.prefix_lists[p] = bot.mention_prefixes + [p]
+    return prefixes
+
+
+class Context(commands.Context):
+    async def send(self, content: str = None, **kwargs):
+        """Send through the outbound queue, ahead of any notifications."""
+        return await self.bot.outbound.send(self.channel.id, content, **kwargs)
 
 
 class GoOutside(commands.AutoShardedBot):
-    def __init__(self, token: str, db_url: str):
+    def __init__(
+        self,
+        token: str,
+        db_url: str,
+        replica_url: str = None,
+        cluster: cluster.ClusterLink = None,
+        **kwargs,
+    ):
+        if Settings.lean_mode:
+            kwargs.update(
+                intents=Settings.lean_intents,
+                member_cache_flags=disnake.MemberCacheFlags.none(),
+                chunk_guilds_at_startup=False,
+            )
+        else:
+            kwargs.setdefault("intents", Settings.intents)
         super().__init__(
-            command_prefix=Settings.prefix,
+            command_prefix=prefix,
             case_insensitive=True,
             description=Settings.description,
             help_command=Settings.help_command,
-            intents=Settings.intents,
             allowed_mentions=Settings.allowed_mentions,
             activity=Settings.activity,
+            **kwargs,
         )
         self.__token = token
         self.__db_url = db_url
+        self.__replica_url = replica_url
         self.started_at = datetime.datetime.now()
+        self.ready_seconds: float | None = None
+        self.cluster = cluster
+        # mention prefixes are known once we're logged in, see on_ready
+        self.mention_prefixes: list[str] = []
+        self.prefix_lists: dict[str, list[str]] = {}  # {prefix: all prefixes}
+        self.loop_lag_task: asyncio.Task | None = None
+        self.metrics_server: asyncio.Server | None = None
+        self.outbound = MessageScheduler(self.send_message)
+        # {phase: seconds}, see startup_phase
+        self.startup_phases: dict[str, float] = {}
+        if Settings.profile_startup:
+            # almost all CPU time before this point is spent importing modules
+            logger.info(f"Startup phase imports took {time.process_time():.3f}s CPU.")
 
     async def on_ready(self):
         logger.info(f"Logged in as {self.user}.")
+        if self.ready_seconds is None:
+            import psutil
+
+            self.ready_seconds = (
+                datetime.datetime.now() - self.started_at
+            ).total_seconds()
+            rss = psutil.Process().memory_info().rss / 2**20
+            logger.info(
+                f"Ready in {self.ready_seconds:.1f}s, {rss:.0f} MiB RSS "
+                f"({'lean' if Settings.lean_mode else 'full'} mode, "
+                f"{len(self.guilds)} guilds)."
+            )
+            if Settings.deferred_cogs:
+                asyncio.create_task(self.load_deferred_cogs())
+        self.mention_prefixes = [f"<@{self.user.id}> ", f"<@!{self.user.id}> "]
+        self.prefix_lists.clear()
 
     def run(self):
         """Custom run method, automatically passes token."""
@@ -60,14 +115,12 @@ class GoOutside(commands.AutoShardedBot):
             pass
 
         logger.info("Running bot setup.")
-        await self.setup()
+        with self.startup_phase("setup"):
+            await self.setup()
 
         logger.info("Running cog setup.")
-        for name, cog in self.cogs.items():
-            try:
-                await cog.setup()
-            except AttributeError:
-                pass
+        with self.startup_phase("cog setup"):
+            await self.setup_cogs(list(self.cogs.values()))
 
         logger.info("Setup complete. Logging in.")
         await super().start(*args, **kwargs)
@@ -75,18 +128,65 @@ class GoOutside(commands.AutoShardedBot):
     async def close(self, exit_code=0):
         self._exit_code = exit_code
 
+        logger.info("Running cog cleanup.")
+        for name, cog in list(self.cogs.items()):
+            cleanup = getattr(cog, "cleanup", None)
+            if cleanup is None:
+                continue
+            try:
+                await cleanup()
+            except Exception:
+                # keep going, so the other cogs and the bot still shut down
+                logger.exception(f"Cleanup failed for cog {name}.")
+
         logger.info("Running bot cleanup.")
         await self.cleanup()
 
-        logger.info("Running cog cleanup.")
-        for name, cog in self.cogs.items():
+        logger.info("Closing connection to discord.")
+        await super().close()
+
+    @contextlib.contextmanager
+    def startup_phase(self, name: str):
+        """Time a phase of startup, logged if Settings.profile_startup is set."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = self.startup_phases[name] = time.perf_counter() - start
+            if Settings.profile_startup:
+                logger.info(f"Startup phase {name} took {elapsed:.3f}s.")
+
+    async def setup_cogs(self, cogs: list[commands.Cog]):
+        """Run async setup for cogs that have it."""
+        for cog in cogs:
             try:
-                await cog.cleanup()
+                await cog.setup()
             except AttributeError:
                 pass
 
-        logger.info("Closing connection to discord.")
-        await super().close()
+    async def import_cogs(self, cog_names: list[str]):
+        """Import extension modules (and everything they import) in a thread,
+        so the event loop can keep working while the imports run."""
+
+        def import_all():
+            for name in cog_names:
+                try:
+                    importlib.import_module(name)
+                except Exception:
+                    # load_cogs will log it
+                    pass
+
+        await asyncio.to_thread(import_all)
+
+    async def load_deferred_cogs(self):
+        """Load non-essential cogs once the bot is ready."""
+        with self.startup_phase("deferred cogs"):
+            await self.import_cogs(Settings.deferred_cogs)
+            before = set(self.cogs)
+            self.load_cogs(Settings.deferred_cogs)
+            await self.setup_cogs(
+                [cog for name, cog in self.cogs.items() if name not in before]
+            )
 
     def load_cogs(self, cog_names: list[str]):
         """Load cogs from a list of names."""
@@ -103,15 +203,77 @@ class GoOutside(commands.AutoShardedBot):
         Use this for any async tasks to be performed before the bot starts.
         (THE BOT WILL NOT BE LOGGED IN WHEN THIS IS CALLED)
         """
-        await db.init(self.__db_url)
-        self.load_cogs(Settings.cogs)
+
+        async def init_db():
+            with self.startup_phase("db init"):
+                await db.init(self.__db_url, self.__replica_url)
+
+        # connect to the database while cog modules are imported
+        db_init = asyncio.create_task(init_db())
+        with self.startup_phase("cog imports"):
+            await self.import_cogs(Settings.cogs)
+        with self.startup_phase("cog loading"):
+            self.load_cogs(Settings.cogs)
+        await db_init
+
+        db.start_flusher()
+        self.outbound.start()
+        if self.cluster:
+            db.owns = self.cluster.owns
+            db.points_changed = self.cluster.broadcast_points
+            await self.cluster.start(self.on_cluster_message)
+        self.loop_lag_task = asyncio.create_task(
+            metrics.monitor_loop_lag(Settings.Metrics.loop_lag_interval)
+        )
+        if Settings.Metrics.port:
+            self.metrics_server = await metrics.start_server(
+                Settings.Metrics.host, Settings.Metrics.port
+            )
 
     async def cleanup(self):
         """Called when bot is closed, before logging out.
         Use this for any async tasks to be performed before the bot exits.
         """
+        if self.cluster:
+            await self.cluster.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.loop_lag_task:
+            self.loop_lag_task.cancel()
+        await self.outbound.close()
+        await db.stop_flusher()
         await db.Tortoise.close_connections()
 
-    async def prefix(self, message: disnake.Message):
+    async def get_context(self, message: disnake.Message, *, cls=Context):
+        return await super().get_context(message, cls=cls)
+
+    async def send_message(self, channel_id: int, content: str | None, kwargs: dict):
+        """Sender for the outbound queue."""
+        return await self.get_partial_messageable(channel_id).send(content, **kwargs)
+
+    def on_cluster_message(
+        self, kind: int, user_id: int, action: int, ts: int, points: int
+    ):
+        """Handle a message from another process in the cluster."""
+        if kind == cluster.ACTION:
+            leveling = self.get_cog("Leveling")
+            if leveling:
+                leveling.enqueue(user_id, action, ts)
+        elif kind == cluster.REGISTER:
+            db.mark_registered(user_id)
+        elif kind == cluster.UNREGISTER:
+            db.forget_user(user_id)
+            if db.owns(user_id):
+                # our batch update may have rewritten rows deleted by the sender
+                return db.delete_rows(user_id)
+        elif kind == cluster.POINTS:
+            db.apply_points(user_id, ts, points)
+        elif kind == cluster.NOTIFY:
+            db.remember_notifications(user_id, ts or None)
+            leveling = self.get_cog("Leveling")
+            if leveling and ts:
+                return leveling.schedule_milestone(user_id)
+
+    def prefix(self, message: disnake.Message):
         """Gets the bot's prefix for a message in a guild. Does not include mention prefix."""
-        return await prefix(self, message, only_guild_prefix=True)
+        return prefix(self, message, only_guild_prefix=True)
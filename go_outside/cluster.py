@@ -0,0 +1,240 @@
+"""Cluster mode: shard groups run in separate processes.
+
+Every user is owned by exactly one process, picked from a hash of their ID.
+Only the owner scores a user's actions and writes their row, so point math and
+caches stay single-writer. Actions seen by other processes are forwarded to the
+owner over Unix sockets. Registrations are broadcast to every process.
+
+Each process loads the full rank index at startup. Owners broadcast every
+change to their users' points, so every process's index stays current. `rank`
+reads non-owned users from the database, so their points are at most one batch
+update behind.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import struct
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from go_outside.settings import Settings
+
+# message type, user_id, action id, timestamp, points
+# POINTS messages carry the old points in the timestamp field, NOTIFY messages
+# the user's DM channel ID, 0 if they opted out.
+MESSAGE = struct.Struct("<BQHqq")
+ACTION = 0
+REGISTER = 1
+UNREGISTER = 2
+POINTS = 3
+NOTIFY = 4
+
+Handler = Callable[[int, int, int, int, int], Awaitable[None] | None]
+
+
+def owner_of(user_id: int, clusters: int) -> int:
+    """Index of the process that owns a user."""
+    # snowflakes share a lot of low bits, mix before taking the modulo
+    return ((user_id * 0x9E3779B97F4A7C15) >> 32) % clusters
+
+
+class ClusterLink:
+    """Local IPC between the processes of a cluster."""
+
+    def __init__(self, index: int, clusters: int, socket_dir: str):
+        self.index = index
+        self.clusters = clusters
+        self.socket_dir = socket_dir
+        self.server: asyncio.AbstractServer | None = None
+        self.handler: Handler | None = None
+
+        # outgoing messages are buffered per peer and written by one task each
+        self.outbox: dict[int, bytearray] = {}
+        self.wakeups: dict[int, asyncio.Event] = {}
+        self.pumps: list[asyncio.Task] = []
+
+        self.forwarded = 0
+        self.received = 0
+        self.dropped = 0
+
+    def socket_path(self, index: int) -> str:
+        return os.path.join(self.socket_dir, f"node-{index}.sock")
+
+    def owns(self, user_id: int) -> bool:
+        return owner_of(user_id, self.clusters) == self.index
+
+    async def start(self, handler: Handler):
+        """Listen for messages from the other processes."""
+        self.handler = handler
+        os.makedirs(self.socket_dir, exist_ok=True)
+        path = self.socket_path(self.index)
+        if os.path.exists(path):
+            os.remove(path)
+        self.server = await asyncio.start_unix_server(self._serve, path)
+
+        for peer in range(self.clusters):
+            if peer == self.index:
+                continue
+            self.outbox[peer] = bytearray()
+            self.wakeups[peer] = asyncio.Event()
+            self.pumps.append(asyncio.create_task(self._pump(peer)))
+        logger.info(f"Cluster node {self.index}/{self.clusters} listening on {path}.")
+
+    async def close(self):
+        # give pending messages a moment to go out
+        for _ in range(10):
+            if not any(self.outbox.values()):
+                break
+            await asyncio.sleep(0.1)
+        for task in self.pumps:
+            task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def send(
+        self,
+        peer: int,
+        kind: int,
+        user_id: int,
+        action: int = 0,
+        ts: int = 0,
+        points: int = 0,
+    ):
+        self.outbox[peer] += MESSAGE.pack(kind, user_id, action, ts, points)
+        self.wakeups[peer].set()
+
+    def forward_action(self, user_id: int, action: int, ts: int):
+        """Send an action to the process that owns the user. Actions for a peer
+        that's been unreachable for a while are dropped, not buffered forever."""
+        peer = owner_of(user_id, self.clusters)
+        if len(self.outbox[peer]) >= Settings.Cluster.outbox_limit * MESSAGE.size:
+            self.dropped += 1
+            return
+        self.send(peer, ACTION, user_id, action, ts)
+        self.forwarded += 1
+
+    def broadcast(self, kind: int, user_id: int, ts: int = 0):
+        """Send a message to every other process."""
+        for peer in self.outbox:
+            self.send(peer, kind, user_id, 0, ts)
+
+    def broadcast_points(self, user_id: int, old_points: int, new_points: int):
+        """Tell every other process that an owned user's points changed."""
+        for peer in self.outbox:
+            self.send(peer, POINTS, user_id, 0, old_points, new_points)
+
+    async def _pump(self, peer: int):
+        """Write buffered messages to a peer, reconnecting as needed."""
+        writer = None
+        while True:
+            await self.wakeups[peer].wait()
+            self.wakeups[peer].clear()
+            try:
+                if writer is None:
+                    _, writer = await asyncio.open_unix_connection(
+                        self.socket_path(peer)
+                    )
+                data = bytes(self.outbox[peer])
+                writer.write(data)
+                await writer.drain()
+                # only ever appended to, so the sent bytes are still at the front
+                del self.outbox[peer][: len(data)]
+            except OSError:
+                # peer isn't up yet or went away, keep the messages and retry
+                logger.warning(f"Cluster node {peer} unreachable, retrying.")
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                await asyncio.sleep(1)
+                self.wakeups[peer].set()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer):
+        try:
+            while True:
+                data = await reader.readexactly(MESSAGE.size)
+                self.received += 1
+                result = self.handler(*MESSAGE.unpack(data))
+                if result is not None:
+                    await result
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+
+def shard_groups(shard_count: int, clusters: int) -> list[list[int]]:
+    """Split shard IDs into contiguous groups, one per process."""
+    size, extra = divmod(shard_count, clusters)
+    groups = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (i < extra)
+        groups.append(list(range(start, end)))
+        start = end
+    return groups
+
+
+def run_node(
+    token: str,
+    db_url: str,
+    replica_url: str | None,
+    index: int,
+    clusters: int,
+    shard_ids: list[int],
+    shard_count: int,
+    lean: bool = False,
+):
+    """Entry point for a single cluster process."""
+    from go_outside.bot import GoOutside
+
+    Settings.lean_mode = lean
+    # every process writes its own journal and serves its own metrics
+    if Settings.Database.journal_path:
+        Settings.Database.journal_path = f"{Settings.Database.journal_path}-node{index}"
+    if Settings.Metrics.port:
+        Settings.Metrics.port += index
+    link = ClusterLink(index, clusters, Settings.Cluster.socket_dir)
+    bot = GoOutside(
+        token,
+        db_url,
+        replica_url,
+        cluster=link,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+    )
+    bot.run()
+
+
+def run_cluster(
+    token: str,
+    db_url: str,
+    replica_url: str | None,
+    clusters: int,
+    shard_count: int,
+    lean: bool = False,
+):
+    """Start one process per shard group and wait for them to exit."""
+    processes = []
+    for index, shard_ids in enumerate(shard_groups(shard_count, clusters)):
+        process = multiprocessing.Process(
+            target=run_node,
+            args=(
+                token,
+                db_url,
+                replica_url,
+                index,
+                clusters,
+                shard_ids,
+                shard_count,
+                lean,
+            ),
+            name=f"go-outside-{index}",
+        )
+        process.start()
+        logger.info(f"Started cluster node {index} (shards {shard_ids}).")
+        processes.append(process)
+    for process in processes:
+        process.join()
@@ -6,8 +6,99 @@ import disnake
 from disnake.ext import commands
 from loguru import logger
 
+from go_outside import cluster
 from go_outside.settings import Settings
-from go_outside.utils import db
+from go_outside.utils import backup, db, members, metrics
+from go_outside.utils.state import ACTION_IDS, ACTIONS
+
+# seconds between progress updates for long-running commands
+PROGRESS_INTERVAL = 5
+
+
+class UserPages(disnake.ui.View):
+    """Paginator for list_users. Pages are fetched from the database one at a
+    time using keyset pagination, so only the current page is ever in memory."""
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        author_id: int,
+        min_points: int = 0,
+        guild: disnake.Guild = None,
+    ):
+        super().__init__(timeout=300)
+        self.bot = bot
+        self.author_id = author_id
+        self.min_points = min_points
+        self.guild = guild
+        self.page_size = Settings.Database.list_users_page_size
+
+        # user_id each page starts after, the last one is the current page
+        self.starts: list[int | None] = [None]
+        self.next_start: int | None = None
+
+    async def fetch_page(
+        self, after: int | None
+    ) -> tuple[list[tuple[int, int]], int | None]:
+        """Get a page of (user_id, points) rows after a user_id, and the user_id
+        the next page starts after (None if this is the last page).
+        With a guild filter, at most list_users_scan users are checked per page,
+        so a page can come back short."""
+        page = []
+        scanned = 0
+        async for rows in db.iter_user_rows(
+            "points",
+            # member lookups go in batches of up to QUERY_LIMIT
+            chunk_size=members.QUERY_LIMIT if self.guild else self.page_size,
+            after=after,
+            replica=True,
+            points__gte=self.min_points,
+        ):
+            last_id = rows[-1][0]
+            scanned += len(rows)
+            if self.guild:
+                in_guild = await members.guild_member_ids(
+                    self.guild, [user_id for user_id, _ in rows]
+                )
+                rows = [row for row in rows if row[0] in in_guild]
+            for user_id, points in rows:
+                if len(page) == self.page_size:
+                    return page, page[-1][0]
+                page.append((user_id, points))
+            if self.guild and scanned >= Settings.Database.list_users_scan:
+                # pick up after the last user checked
+                return page, last_id
+        return page, None
+
+    async def render(self) -> str:
+        """Fetch and format the current page, updating the buttons."""
+        page, self.next_start = await self.fetch_page(self.starts[-1])
+
+        self.previous.disabled = len(self.starts) == 1
+        self.next.disabled = self.next_start is None
+
+        if not page and self.next_start is None:
+            return "No users found."
+        lines = [f"Page {len(self.starts)}"]
+        if not page:
+            lines.append("No members of this server here, there may be more.")
+        for user_id, points in page:
+            user = self.bot.get_user(user_id)
+            lines.append(f"{user_id} ({user or 'not cached'}): points={points}")
+        return "\n".join(lines)
+
+    async def interaction_check(self, inter: disnake.MessageInteraction) -> bool:
+        return inter.author.id == self.author_id
+
+    @disnake.ui.button(label="Previous", style=disnake.ButtonStyle.secondary)
+    async def previous(self, button, inter: disnake.MessageInteraction):
+        self.starts.pop()
+        await inter.response.edit_message(content=await self.render(), view=self)
+
+    @disnake.ui.button(label="Next", style=disnake.ButtonStyle.secondary)
+    async def next(self, button, inter: disnake.MessageInteraction):
+        self.starts.append(self.next_start)
+        await inter.response.edit_message(content=await self.render(), view=self)
 
 
 class Admin(commands.Cog):
@@ -17,18 +108,220 @@ class Admin(commands.Cog):
         self.bot = bot
 
     @commands.command()
-    async def list_users(self, ctx: commands.Context):
-        db_users = await db.User.all()
-        if not db_users:
-            await ctx.send("Database is empty.")
+    async def list_users(
+        self,
+        ctx: commands.Context,
+        min_points: int = 0,
+        scope: typing.Literal["here"] = None,
+    ):
+        """List registered users a page at a time.
+        Pass `here` to only show members of this server."""
+        view = UserPages(
+            self.bot, ctx.author.id, min_points, ctx.guild if scope else None
+        )
+        content = await view.render()
+        if view.next_start is None:
+            await ctx.send(content)
+            return
+        await ctx.send(content, view=view)
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def register_guild(self, ctx: commands.Context, role: disnake.Role = None):
+        """Register every member of this server, or only members with a role."""
+        who = f"members with {role.name}" if role else "members"
+        message = await ctx.send(f"Registering {who}...")
+        start = last_progress = time.perf_counter()
+        seen = registered = 0
+
+        async for user_ids in members.iter_member_ids(
+            ctx.guild, role, Settings.Database.register_chunk_size
+        ):
+            new_ids = await db.create_users(user_ids)
+            if self.bot.cluster:
+                for user_id in new_ids:
+                    self.bot.cluster.broadcast(cluster.REGISTER, user_id)
+            seen += len(user_ids)
+            registered += len(new_ids)
+            if time.perf_counter() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.perf_counter()
+                await message.edit(
+                    content=f"Registering {who}... {registered} new out of {seen} so far."
+                )
+
+        logger.info(f"Registered {registered} users from guild {ctx.guild.id}.")
+        await message.edit(
+            content=f"Registered {registered} new users out of {seen} {who} "
+            f"in {time.perf_counter() - start:.1f}s."
+        )
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    async def events(self, ctx: commands.Context, *event_types: str):
+        """Choose which event types count in this server, or `all` of them.
+        Without arguments, shows what currently counts."""
+        leveling = self.bot.get_cog("Leveling")
+        if not leveling:
+            await ctx.send("Leveling isn't loaded.")
+            return
+        tracked = [ACTIONS[action] for action in leveling.tracked_actions]
+        config = await db.get_config(ctx.guild.id)
+
+        if not event_types:
+            mask = config.event_mask if config else db.ALL_EVENTS
+            counted = [name for name in tracked if mask >> ACTION_IDS[name] & 1]
+            await ctx.send(
+                f"Counting: {', '.join(counted) or 'nothing'}\n"
+                f"Options: {', '.join(tracked)}, all"
+            )
             return
-        msg = ""
-        for db_user in db_users:
-            user = self.bot.get_user(db_user.user_id)
-            msg += (
-                f"{db_user.user_id} ({user or 'not cached'}): points={db_user.points}\n"
+
+        if event_types == ("all",):
+            mask = db.ALL_EVENTS
+        else:
+            unknown = [name for name in event_types if name not in tracked]
+            if unknown:
+                await ctx.send(
+                    f"Unknown event types: {', '.join(unknown)}. "
+                    f"Options: {', '.join(tracked)}, all"
+                )
+                return
+            mask = 0
+            for name in event_types:
+                mask |= 1 << ACTION_IDS[name]
+
+        if config is None:
+            config, _ = await db.create_config(ctx.guild.id)
+        await db.update_config(config, event_mask=mask)
+        leveling.update_event_mask()
+        await ctx.send(
+            "Now counting "
+            + ("every event type." if mask == db.ALL_EVENTS else ", ".join(event_types))
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context):
+        """Show hot path metrics."""
+        lines = []
+        leveling = self.bot.get_cog("Leveling")
+        if leveling:
+            lines.append(
+                f"**Events**: {leveling.events_received} queued, "
+                f"{leveling.events_dropped} dropped, "
+                f"{leveling.queue.qsize()} waiting, "
+                f"{leveling.coalescing_ratio:.2f} per update"
+            )
+            by_action = ", ".join(
+                f"{action}={counter.value}"
+                for action, counter in zip(ACTIONS, leveling.events_by_action)
+                if counter.value
+            )
+            lines.append(f"**By type**: {by_action or 'none'}")
+
+        for name, cache in (
+            ("User cache", db.UserCache.user_cache),
+            ("Config cache", db.config_cache),
+        ):
+            lookups = cache.hits + cache.misses
+            ratio = cache.hits / lookups if lookups else 0
+            lines.append(
+                f"**{name}**: {len(cache)} entries, {ratio:.1%} hit ratio, "
+                f"{cache.evictions} evictions"
             )
-        await ctx.send(msg)
+
+        durations = ", ".join(
+            f"{backend} p50 {hist.quantile(0.5)}s ({hist.count} runs)"
+            for backend, hist in db.batch_durations.items()
+            if hist.count
+        )
+        lines.append(
+            f"**Batch updates**: p50 {db.batch_sizes.quantile(0.5)} users, "
+            f"{durations or 'none yet'}, "
+            f"{len(db.UserCache.batch_update_records)} users pending"
+        )
+        lines.append(
+            f"**Event loop lag**: p50 {metrics.loop_lag.quantile(0.5)}s, "
+            f"p99 {metrics.loop_lag.quantile(0.99)}s"
+        )
+        await ctx.send("\n".join(lines))
+
+    @commands.command()
+    @commands.is_owner()
+    async def rescore(self, ctx: commands.Context, points_scaling: int):
+        """Change the points scaling and rescale everyone's points to match."""
+        old_scaling = Settings.Leveling.points_scaling
+        if points_scaling < 1:
+            await ctx.send("Points scaling must be at least 1.")
+            return
+        if points_scaling == old_scaling:
+            await ctx.send(f"Points scaling is already {old_scaling}.")
+            return
+        if self.bot.cluster:
+            await ctx.send("Rescoring isn't supported in cluster mode.")
+            return
+
+        await ctx.send(f"Rescaling points from {old_scaling} to {points_scaling}...")
+        start = time.perf_counter()
+
+        # stop scoring while points are inconsistent, events keep queueing up
+        leveling = self.bot.get_cog("Leveling")
+        try:
+            if leveling:
+                await leveling.cleanup()
+            await db.rescale_points(points_scaling)
+        finally:
+            if leveling:
+                await leveling.setup()
+
+        logger.warning(f"Points scaling changed to {points_scaling}.")
+        await ctx.send(
+            f"Rescaled {len(db.rank_index)} users in {time.perf_counter() - start:.1f}s."
+        )
+
+    @commands.command()
+    @commands.is_owner()
+    async def export(self, ctx: commands.Context, path: str):
+        """Dump the database to a gzipped NDJSON file on the bot's host."""
+        start = time.perf_counter()
+        # write pending updates first so the dump is current
+        await db.batch_update_users()
+        counts = await backup.export_db(path)
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        await ctx.send(
+            f"Exported {summary} rows to `{path}` "
+            f"in {time.perf_counter() - start:.1f}s."
+        )
+
+    @commands.command(name="import")
+    @commands.is_owner()
+    async def import_(self, ctx: commands.Context, path: str):
+        """Insert or update rows from a dump file on the bot's host."""
+        if self.bot.cluster:
+            await ctx.send("Importing isn't supported in cluster mode.")
+            return
+
+        await ctx.send(f"Importing `{path}`...")
+        start = time.perf_counter()
+
+        # stop scoring while the tables change, events keep queueing up
+        leveling = self.bot.get_cog("Leveling")
+        try:
+            if leveling:
+                await leveling.cleanup()
+            await db.batch_update_users()
+            counts = await backup.import_db(path)
+            await db.reload()
+        finally:
+            if leveling:
+                await leveling.setup()
+
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        await ctx.send(
+            f"Imported {summary} rows in {time.perf_counter() - start:.1f}s."
+        )
 
 
 def setup(bot: commands.Bot):
@@ -1,10 +1,9 @@
+import asyncio
 import datetime
 import itertools
 import sys
 
 import disnake
-import psutil
-import pygit2
 from disnake.ext import commands
 from loguru import logger
 
@@ -18,14 +17,21 @@ class General(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-
-    def format_commit(self, commit: pygit2.Commit):
-        short, _, _ = commit.message.partition("\n")
-        short_sha2 = commit.hex[0:6]
-        commit_tz = datetime.timezone(
-            datetime.timedelta(minutes=commit.commit_time_offset)
-        )
-        commit_time = datetime.datetime.fromtimestamp(commit.commit_time).astimezone(
+        # (sha, message, commit time, utc offset in minutes), read once in setup
+        self.recent_commits: list[tuple[str, str, int, int]] = []
+
+    async def setup(self):
+        try:
+            self.recent_commits = await asyncio.to_thread(self.get_last_commits, 3)
+        except Exception:
+            logger.exception("Failed to read recent commits.")
+
+    def format_commit(self, commit: tuple[str, str, int, int]):
+        sha, message, commit_time, offset_minutes = commit
+        short, _, _ = message.partition("\n")
+        short_sha2 = sha[0:6]
+        commit_tz = datetime.timezone(datetime.timedelta(minutes=offset_minutes))
+        commit_time = datetime.datetime.fromtimestamp(commit_time).astimezone(
             commit_tz
         )
 
@@ -34,16 +40,18 @@ class General(commands.Cog):
             datetime.datetime.utcnow()
             - commit_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
         )
-        return f"[`{short_sha2}`]({Settings.repo_url}/commit/{commit.hex}) {short} ({offset} ago)"
+        return f"[`{short_sha2}`]({Settings.repo_url}/commit/{sha}) {short} ({offset} ago)"
 
     def get_last_commits(self, count: int = 3):
+        import pygit2
+
         repo = pygit2.Repository(".git")
-        commits = list(
-            itertools.islice(
+        return [
+            (c.hex, c.message, c.commit_time, c.commit_time_offset)
+            for c in itertools.islice(
                 repo.walk(repo.head.target, pygit2.GIT_SORT_TOPOLOGICAL), count
             )
-        )
-        return "\n".join(self.format_commit(c) for c in commits)
+        ]
 
     @commands.command()
     async def about(self, ctx: commands.Context):
@@ -65,7 +73,7 @@ class General(commands.Cog):
         embed.add_field(name="Support server", value=f"soon:tm:")
         embed.add_field(name="Add me!", value=f"[invite]({Settings.invite_url})")
 
-        revision = self.get_last_commits(2)
+        revision = "\n".join(self.format_commit(c) for c in self.recent_commits[:2])
         embed.add_field(
             name="\u200b", value=f"{GIT} Recent commits:\n{revision}", inline=False
         )
@@ -1,116 +1,422 @@
-import datetime
+import asyncio
+import itertools
+import math
 import time
 import typing
+from bisect import bisect_right
 
 import disnake
 from disnake.ext import commands
 from loguru import logger
 
+from go_outside import cluster
 from go_outside.settings import Settings
-from go_outside.utils import db
+from go_outside.utils import db, members, metrics
+from go_outside.utils.events import Event, snowflake_time
+from go_outside.utils.format import approximate_timedelta
+from go_outside.utils.state import ACTIONS, action_id
+from go_outside.utils.timers import TimerWheel
 
-
-def to_unix(dt: datetime.datetime) -> float:
-    """Convert a datetime object to a unix time int."""
-    return time.mktime(dt.timetuple())
+MESSAGE_CREATE = action_id("message_create")
+MESSAGE_EDIT = action_id("message_edit")
+REACTION_ADD = action_id("reaction_add")
+REACTION_REMOVE = action_id("reaction_remove")
+TYPING = action_id("typing")
+VOICE_STATE_UPDATE = action_id("voice_state_update")
+PRESENCE_UPDATE = action_id("presence_update")
 
 
 def calculate_points(time_since: float) -> int:
     """Calculation determining how many points to assign to a user after an event."""
     # TODO: decide how to scale points
     # points = (time_since // 3600) ** 2
+    # events can arrive out of order (forwarded late from another process)
+    time_since = max(time_since, 0)
     return int((time_since // Settings.Leveling.points_scaling) ** 2)
 
 
+# LEVEL_THRESHOLDS[n] is the number of points needed to reach level n
+LEVEL_THRESHOLDS = [level**4 for level in range(Settings.Leveling.level_table_size)]
+
+
 def calculate_level(points: int) -> int:
     """Calculation determining what level a user is based on their points."""
     # TODO make this configurable, decide how to scale level
-    return int(points ** (1 / 4))
+    if points < LEVEL_THRESHOLDS[-1]:
+        return bisect_right(LEVEL_THRESHOLDS, points) - 1
+    # past the end of the table, integer 4th root is still exact
+    return math.isqrt(math.isqrt(points))
 
 
-class Leveling(commands.Cog):
-    """Leveling system commands."""
+def level_threshold(level: int) -> int:
+    """Points needed to reach a level."""
+    if level < len(LEVEL_THRESHOLDS):
+        return LEVEL_THRESHOLDS[level]
+    return level**4
 
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
 
-        # # user_id: (action, timestamp)
-        # self.last_action_cache: dict[int, tuple[str, float]] = {}
-        # # user_id: duration
-        # self.personal_best_cache: dict[int, int] = {}
-        # # user_id: points
-        # self.points_cache: dict[int, int] = {}
+def projected_points(points: int, last_action: int, now: int) -> int:
+    """Points a user would have if they acted at `now`, without writing anything."""
+    return points + calculate_points(now - last_action)
 
-    async def process_action(self, user: disnake.Member, action: str, timestamp: float):
-        """When we detect an action by a user, update cache and assign points."""
-        timestamp_int: int = int(timestamp)
 
-        # ignore bots
-        if user.bot:
-            return
+def next_milestone(points: int, last_action: int, now: int) -> int:
+    """Unix time of a user's next announced level-up or time-outside milestone
+    after `now`, if they don't act before then."""
+    step = Settings.Leveling.level_notification_step
+    level = calculate_level(projected_points(points, last_action, now))
+    # smallest k with points + k ** 2 >= threshold, reached k * scaling seconds in
+    needed = level_threshold((level // step + 1) * step) - points
+    due = last_action + (math.isqrt(needed - 1) + 1) * Settings.Leveling.points_scaling
+    for milestone in Settings.Leveling.milestones:
+        if last_action + milestone > now:
+            return min(due, last_action + milestone)
+    return due
 
-        # # ignore users who haven't opted in
-        # if user.id not in db.user_cache:
-        #     return
-        #     # logger.debug(
-        #     #     f"adding user to cache | {user.id=} {user.name=} | {action=} {timestamp=}"
-        #     # )
-        #     # self.last_action_cache[user.id] = (action, timestamp)
-        #     # self.points_cache[user.id] = 0
-        #     # return
 
-        db_user = await db.get_user(user.id)  # will be None if user hasn't opted in
+class Leveling(commands.Cog):
+    """Leveling system commands."""
 
-        # ignore users who haven't opted in
-        if db_user is None:
-            return
+    # action ids with a listener below, the ones guilds can choose from
+    tracked_actions = (
+        MESSAGE_CREATE,
+        MESSAGE_EDIT,
+        REACTION_ADD,
+        REACTION_REMOVE,
+        TYPING,
+        VOICE_STATE_UPDATE,
+        PRESENCE_UPDATE,
+    )
 
-        last_action_type = db_user.last_action_type
-        last_action_timestamp = db_user.last_action_timestamp
-        time_since = timestamp_int - last_action_timestamp
-        points_to_add = calculate_points(time_since)
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
 
-        new_points = db_user.points + points_to_add
-        logger.debug(
-            f"updating user "
-            f"| {user.id=} {user.name=} "
-            f"| {action=} {timestamp_int=} "
-            f"| {last_action_type=} {last_action_timestamp=} "
-            f"| {time_since=} {points_to_add=} "
-            f"| {new_points=}"
+        # ingestion queue of events to be scored
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(
+            Settings.Leveling.queue_size
         )
-
-        # self.points_cache[user.id] += points_to_add
-        # self.last_action_cache[user.id] = (action, timestamp_int)
-
-        # TODO: don't update the database every time PLEASE GOD
-        # db_user.points = new_points
-        # db_user.last_action_type = last_action_type
-        # db_user.last_action_timestamp = last_action_timestamp
-        # db.user_cache[user.id] = db_user
-        # await db_user.save()
-        await db.update_user(
-            db_user,
-            points=new_points,
-            last_action_type=last_action_type,
-            last_action_timestamp=timestamp,
+        self.worker_task: asyncio.Task | None = None
+        # coalesced events waiting to be applied, see coalesce
+        self.pending: dict[int, list] = {}
+        # event types that count in at least one of our guilds, see update_event_mask
+        self.event_mask = db.ALL_EVENTS
+        # each owned user's next milestone, see milestone_loop
+        self.milestones: TimerWheel | None = None
+        # due time of each user's current timer, older ones in the wheel are stale
+        self.milestone_due: dict[int, int] = {}
+        self.milestone_task: asyncio.Task | None = None
+
+        # pipeline counters
+        self.events_received = 0
+        self.events_dropped = 0
+        self.users_updated = 0
+        self.events_by_action = [
+            metrics.Counter(
+                "go_outside_events_total", "Events received.", {"action": action}
+            )
+            for action in ACTIONS
+        ]
+        self.apply_duration = metrics.Histogram(
+            "go_outside_apply_actions_seconds",
+            "Time taken to score a batch of coalesced events.",
+            metrics.LATENCY_BUCKETS,
         )
+        for name, help, func in (
+            ("queue_depth", "Events waiting to be scored.", self.queue.qsize),
+            (
+                "coalescing_ratio",
+                "Events per user update.",
+                lambda: self.coalescing_ratio,
+            ),
+        ):
+            metrics.Gauge(f"go_outside_{name}", help, func)
+        for name, help in (
+            ("events_received", "Events queued for scoring."),
+            ("events_dropped", "Events dropped because the queue was full."),
+            ("users_updated", "User updates applied."),
+        ):
+            metrics.CounterFunc(
+                f"go_outside_{name}_total", help, lambda name=name: getattr(self, name)
+            )
+
+    @property
+    def coalescing_ratio(self) -> float:
+        """Average number of events folded into each user update."""
+        return self.events_received / max(self.users_updated, 1)
+
+    async def setup(self):
+        self.update_event_mask()
+        self.worker_task = asyncio.create_task(self.worker())
+        if Settings.Leveling.milestone_notifications:
+            self.milestones = TimerWheel(int(time.time()))
+            self.milestone_task = asyncio.create_task(self.milestone_loop())
+
+    async def cleanup(self):
+        if self.milestone_task:
+            self.milestone_task.cancel()
+            self.milestone_task = None
+            self.milestones = None
+            self.milestone_due.clear()
+        if self.worker_task:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+        # score whatever is still queued so it makes it into the final flush
+        self.drain_queue()
+        await self.apply_actions(self.pending)
+
+    def update_event_mask(self):
+        """Recompute which event types any guild we're in counts. Events of other
+        types are dropped at the top of their listener without any lookups."""
+        if not self.bot.guilds:
+            # not connected yet
+            self.event_mask = db.ALL_EVENTS
+            return
+        mask = 0
+        for guild in self.bot.guilds:
+            mask |= db.event_masks.get(guild.id, db.ALL_EVENTS)
+            if mask == db.ALL_EVENTS:
+                break
+        self.event_mask = mask
+
+    def counts(self, guild_id: int | None, action: int) -> bool:
+        """Whether an event type counts in a guild, or in DMs if guild_id is None.
+        DMs count whatever any guild counts."""
+        if not self.event_mask >> action & 1:
+            return False
+        if guild_id is None:
+            return True
+        return bool(db.event_masks.get(guild_id, db.ALL_EVENTS) >> action & 1)
+
+    def process_action(self, user_id: int, action: int, timestamp: int):
+        """When we detect an action by a user, queue it up to be scored."""
+        # ignore users who haven't opted in, bots can't register
+        if user_id not in db.registered_ids:
+            return
+
+        link = self.bot.cluster
+        if link and not link.owns(user_id):
+            link.forward_action(user_id, action, timestamp)
+            return
+        self.enqueue(user_id, action, timestamp)
+
+    def enqueue(self, user_id: int, action: int, timestamp: int):
+        """Queue an action from a user this process owns."""
+        self.events_by_action[action].inc()
+        try:
+            self.queue.put_nowait(Event(user_id, action, timestamp))
+        except asyncio.QueueFull:
+            self.events_dropped += 1
+            return
+        self.events_received += 1
+
+    def drain_queue(self):
+        """Coalesce everything currently in the queue into self.pending."""
+        while not self.queue.empty():
+            self.coalesce(self.pending, self.queue.get_nowait())
+
+    def coalesce(self, pending: dict[int, list], event: Event):
+        """Fold an event into the pending update for its user.
+
+        Points earned between events in the same window are summed and sessions
+        between them collected as they come in, so the result is identical to
+        scoring every event individually. Events older than the last one folded
+        in add nothing and are dropped.
+        """
+        user_id, action, timestamp = event.user_id, event.action, event.timestamp
+        entry = pending.get(user_id)
+        if entry is None:
+            # [first timestamp, last timestamp, last action, points between them,
+            #  (length, end) of sessions between them or None]
+            pending[user_id] = [timestamp, timestamp, action, 0, None]
+        elif timestamp >= entry[1]:
+            gap = timestamp - entry[1]
+            entry[3] += calculate_points(gap)
+            if gap >= Settings.Leveling.min_session:
+                if entry[4] is None:
+                    entry[4] = []
+                entry[4].append((gap, timestamp))
+            entry[1] = timestamp
+            entry[2] = action
+
+    async def worker(self):
+        """Pull events off the queue, collapse them per user over a short window,
+        and apply one update per user."""
+        while True:
+            self.coalesce(self.pending, await self.queue.get())
+            await asyncio.sleep(Settings.Leveling.coalesce_window)
+            self.drain_queue()
+            start = time.perf_counter()
+            try:
+                await self.apply_actions(self.pending)
+                self.apply_duration.observe(time.perf_counter() - start)
+            except Exception:
+                logger.exception(f"Failed to apply {len(self.pending)} user updates.")
+
+    async def apply_actions(self, pending: dict[int, list]):
+        """Assign points for a batch of coalesced events. Entries are removed from
+        pending as they're applied, so an interrupted batch can be resumed."""
+        await db.prefetch_users(pending)
+        for user_id, (first, last, action, points_between, gaps) in list(
+            pending.items()
+        ):
+            db_user = await db.get_user(user_id)
+            if db_user is None or last < db_user.last_action_timestamp:
+                # unregistered, or only stale events forwarded late
+                del pending[user_id]
+                continue
+
+            time_since = max(first - db_user.last_action_timestamp, 0)
+            if time_since >= Settings.Leveling.min_session:
+                gaps = [(time_since, first), *(gaps or ())]
+            sessions = None
+            if gaps:
+                sessions = await db.get_sessions(user_id)
+
+            # no awaits past this point, so an entry is either fully applied or not
+            del pending[user_id]
+            points_to_add = calculate_points(time_since) + points_between
+            new_points = db_user.points + points_to_add
+            logger.debug(
+                "updating user | {} | {} {}..{} | {} | {}",
+                user_id,
+                ACTIONS[action],
+                first,
+                last,
+                points_to_add,
+                new_points,
+            )
+
+            updates = {}
+            if sessions:
+                for length, end in gaps:
+                    db.record_session(sessions, length, end)
+                longest = max(length for length, _ in gaps)
+                if longest > db_user.personal_best:
+                    updates["personal_best"] = longest
+            db.update_user(
+                db_user,
+                points=new_points,
+                last_action_type=action,
+                last_action_timestamp=last,
+                **updates,
+            )
+            self.users_updated += 1
+            if self.milestones is not None and user_id in db.notify_channels:
+                self.schedule(user_id, next_milestone(new_points, last, last))
+
+    async def milestone_loop(self):
+        """Schedule the next milestone of every owned user who opted in, then
+        fire timers as they come due. Users are only read once here, acting
+        reschedules them."""
+        now = self.milestones.now
+        user_ids = [user_id for user_id in db.notify_channels if db.owns(user_id)]
+        size = Settings.Database.batch_load_size
+        for i in range(0, len(user_ids), size):
+            for user_id, points, last_action in await db.User.filter(
+                user_id__in=user_ids[i : i + size]
+            ).values_list("user_id", "points", "last_action_timestamp"):
+                self.schedule(user_id, next_milestone(points, last_action, now))
+        logger.info(f"Scheduled milestones for {len(self.milestones)} users.")
+
+        while True:
+            await asyncio.sleep(1)
+            fired = [
+                (user_id, due)
+                for user_id, due in self.milestones.advance(int(time.time()))
+                if self.milestone_due.get(user_id) == due
+            ]
+            if not fired:
+                continue
+            await db.prefetch_users(user_id for user_id, _ in fired)
+            for user_id, due in fired:
+                try:
+                    await self.fire_milestone(user_id, due)
+                except Exception:
+                    logger.exception(f"Failed to notify {user_id} of a milestone.")
+
+    async def schedule_milestone(self, user_id: int):
+        """Schedule the next milestone of a user who just opted in."""
+        if self.milestones is None or not db.owns(user_id):
+            return
+        db_user = await db.get_user(user_id)
+        if db_user:
+            self.schedule(
+                user_id,
+                next_milestone(
+                    db_user.points, db_user.last_action_timestamp, int(time.time())
+                ),
+            )
+
+    def schedule(self, user_id: int, due: int):
+        """Set a user's next milestone. Timers aren't cancelled, a replaced one
+        stays in the wheel and is skipped when it fires."""
+        if self.milestone_due.get(user_id) != due:
+            self.milestone_due[user_id] = due
+            self.milestones.add(user_id, due)
+
+    async def fire_milestone(self, user_id: int, due: int):
+        channel_id = db.notify_channels.get(user_id)
+        db_user = await db.get_user(user_id)
+        if channel_id is None or db_user is None:
+            self.milestone_due.pop(user_id, None)
+            return
+        # they may have acted while we waited for the user, rescheduling it
+        if self.milestone_due.get(user_id) != due:
+            return
+        points, last_action = db_user.points, db_user.last_action_timestamp
+        self.schedule(user_id, next_milestone(points, last_action, due))
+
+        lines = []
+        level = calculate_level(projected_points(points, last_action, due))
+        if level > calculate_level(projected_points(points, last_action, due - 1)):
+            lines.append(f"You reached level {level}!")
+        if due - last_action in Settings.Leveling.milestones:
+            outside = approximate_timedelta(due - last_action)
+            lines.append(f"You've been outside for {outside}!")
+
+        self.bot.outbound.notify(channel_id, " ".join(lines))
 
     async def process_presence(self, before: disnake.Member, after: disnake.Member):
         """Handle things like presence updates"""
         pass
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.update_event_mask()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: disnake.Guild):
+        self.update_event_mask()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: disnake.Guild):
+        self.update_event_mask()
+
+    # Raw events fire whether or not the message/member is cached, and carry IDs
+    # directly, so listeners don't depend on the message cache.
+    # Each listener first checks whether the event type counts in its guild.
+
     @commands.Cog.listener()
     async def on_message(self, message: disnake.Message):
-        await self.process_action(
-            message.author, "message_create", to_unix(message.created_at)
+        if not self.counts(message.guild and message.guild.id, MESSAGE_CREATE):
+            return
+        self.process_action(
+            message.author.id, MESSAGE_CREATE, snowflake_time(message.id)
         )
 
     @commands.Cog.listener()
-    async def on_message_edit(self, message: disnake.Message):
-        await self.process_action(
-            message.author, "message_edit", to_unix(message.created_at)
-        )
+    async def on_raw_message_edit(self, payload: disnake.RawMessageUpdateEvent):
+        if not self.counts(payload.guild_id, MESSAGE_EDIT):
+            return
+        author = payload.data.get("author")
+        # link embeds also send updates, only count edits by the author
+        if author is None or payload.data.get("edited_timestamp") is None:
+            return
+        self.process_action(int(author["id"]), MESSAGE_EDIT, int(time.time()))
 
     # @commands.Cog.listener()
     # async def on_message_delete(self, message: disnake.Message):
@@ -119,37 +425,89 @@ class Leveling(commands.Cog):
     #     )
 
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction: disnake.Reaction, user: disnake.Member):
-        await self.process_action(user, "reaction_add", time.time())
+    async def on_raw_reaction_add(self, payload: disnake.RawReactionActionEvent):
+        if not self.counts(payload.guild_id, REACTION_ADD):
+            return
+        self.process_action(payload.user_id, REACTION_ADD, int(time.time()))
 
     @commands.Cog.listener()
-    async def on_reaction_remove(self, reaction, user: disnake.Member):
-        await self.process_action(user, "reaction_remove", time.time())
+    async def on_raw_reaction_remove(self, payload: disnake.RawReactionActionEvent):
+        if not self.counts(payload.guild_id, REACTION_REMOVE):
+            return
+        self.process_action(payload.user_id, REACTION_REMOVE, int(time.time()))
 
     @commands.Cog.listener()
-    async def on_typing(self, channel, user: disnake.Member, when: datetime.datetime):
-        await self.process_action(user, "typing", to_unix(when))
+    async def on_raw_typing(self, payload: disnake.RawTypingEvent):
+        if not self.counts(payload.guild_id, TYPING):
+            return
+        self.process_action(payload.user_id, TYPING, int(payload.timestamp.timestamp()))
 
     @commands.Cog.listener()
-    async def on_voice_state_update(self, user: disnake.Member, before, after):
-        await self.process_action(user, "voice_state_update", time.time())
+    async def on_voice_state_update(self, member: disnake.Member, before, after):
+        if not self.counts(member.guild.id, VOICE_STATE_UPDATE):
+            return
+        self.process_action(member.id, VOICE_STATE_UPDATE, int(time.time()))
 
     @commands.Cog.listener()
     async def on_presence_update(self, before: disnake.Member, after: disnake.Member):
-        await self.process_action(after, "presence_update", time.time())
+        if not self.counts(after.guild.id, PRESENCE_UPDATE):
+            return
+        self.process_action(after.id, PRESENCE_UPDATE, int(time.time()))
 
     @commands.command()
     async def register(self, ctx: commands.Context):
         """Join the game!"""
-        await db.create_user(user_id=ctx.author.id)
-        prefix = await self.bot.prefix(ctx.message)
+        prefix = self.bot.prefix(ctx.message)
+        _, created = await db.create_user(user_id=ctx.author.id)
+        if not created:
+            await ctx.send(
+                f"You're already registered! Leave the game with `{prefix}unregister`."
+            )
+            return
+        if self.bot.cluster:
+            self.bot.cluster.broadcast(cluster.REGISTER, ctx.author.id)
         await ctx.send(f"Signup successful! Leave the game with `{prefix}unregister`.")
 
+    @commands.command()
+    async def notify(
+        self, ctx: commands.Context, setting: typing.Literal["on", "off"] = None
+    ):
+        """Turn DMs for level-ups and time-outside milestones on or off."""
+        prefix = self.bot.prefix(ctx.message)
+        enabled = ctx.author.id in db.notify_channels
+        if setting is None:
+            await ctx.send(
+                f"Milestone DMs are {'on' if enabled else 'off'}. "
+                f"Change this with `{prefix}notify on` or `{prefix}notify off`."
+            )
+            return
+        if not Settings.Leveling.milestone_notifications:
+            await ctx.send("Milestone DMs are disabled on this bot.")
+            return
+        if ctx.author.id not in db.registered_ids:
+            await ctx.send(
+                f"You are not registered with the bot, use `{prefix}register` to register."
+            )
+            return
+
+        if setting == "on":
+            channel = ctx.author.dm_channel or await ctx.author.create_dm()
+            channel_id = channel.id
+        else:
+            channel_id = None
+        await db.set_notifications(ctx.author.id, channel_id)
+        if self.bot.cluster:
+            self.bot.cluster.broadcast(cluster.NOTIFY, ctx.author.id, channel_id or 0)
+        if channel_id:
+            await self.schedule_milestone(ctx.author.id)
+        await ctx.send(f"Milestone DMs turned {setting}.")
+
     @commands.command()
     async def unregister(self, ctx: commands.Context):
         """Delete your data from the bot and opt out of the game."""
-        await db.User.filter(user_id=ctx.author.id).delete()
-        del db.UserCache.user_cache[ctx.author.id]
+        await db.delete_user(ctx.author.id)
+        if self.bot.cluster:
+            self.bot.cluster.broadcast(cluster.UNREGISTER, ctx.author.id)
         await ctx.send("Successfully deleted your data from the bot.")
 
     @commands.command()
@@ -162,7 +520,7 @@ class Leveling(commands.Cog):
         if not user:
             user = ctx.author
 
-        prefix = await self.bot.prefix(ctx.message)
+        prefix = self.bot.prefix(ctx.message)
         db_user = await db.get_user(user.id)
 
         if db_user is None:
@@ -175,12 +533,138 @@ class Leveling(commands.Cog):
                 await ctx.send("This user is not registered with the bot.")
                 return
 
-        points = db_user.points
+        points = projected_points(
+            db_user.points, db_user.last_action_timestamp, int(time.time())
+        )
+        # ranked by points as of their last action
+        position = db.rank_position(db_user)
+        if position:
+            place = f"rank #{position} of {len(db.rank_index)}"
+        else:
+            place = f"unranked, {len(db.rank_index)} users"
 
         if user == ctx.author:
-            await ctx.send(f"You have {points} points")
+            await ctx.send(f"You have {points} points ({place})")
         else:
-            await ctx.send(f"{user} has {points} points (estimated)")
+            await ctx.send(f"{user} has {points} points (estimated, {place})")
+
+    @commands.command(aliases=["outside"])
+    async def sessions(
+        self,
+        ctx: commands.Context,
+        user: typing.Union[disnake.User, disnake.Member] = None,
+    ):
+        """View time spent outside."""
+        if not user:
+            user = ctx.author
+
+        db_user = await db.get_user(user.id)
+        if db_user is None:
+            await ctx.send("This user is not registered with the bot.")
+            return
+        stats = await db.get_sessions(user.id)
+
+        now = int(time.time())
+        week_total, week_longest = stats.this_week(now)
+        month_total, month_longest = stats.this_month(now)
+        recent = stats.recent_sessions()
+        t = approximate_timedelta
+
+        lines = [
+            f"**Time outside for {user}**",
+            f"Personal best: {t(db_user.personal_best)}",
+            f"Current streak: {stats.current_streak(now)} days",
+            f"Today: {t(stats.today(now))}",
+            f"This week: {t(week_total)} (longest {t(week_longest)})",
+            f"This month: {t(month_total)} (longest {t(month_longest)})",
+        ]
+        if recent:
+            lines.append(
+                f"Last {len(recent)} sessions: average {t(sum(recent) / len(recent))}"
+            )
+        await ctx.send("\n".join(lines))
+
+    async def guild_top(
+        self, guild: disnake.Guild, count: int
+    ) -> tuple[list[tuple[int, int]], bool]:
+        """The top `count` (user_id, points) rows among a guild's members, and
+        whether the scan stopped at its limit before finding them.
+
+        With the member cache, the global ranking is walked until the guild's
+        top registered members were all found, so the result is exact. In lean
+        mode every batch of users is a gateway request, so only the top
+        lean_leaderboard_scan users are checked.
+        """
+        rows = []
+        if not Settings.lean_mode:
+            member_ids = {
+                member.id
+                for member in guild.members
+                if member.id in db.registered_ids
+            }
+            needed = min(count, len(member_ids))
+            for row in db.rank_index:
+                if len(rows) >= needed:
+                    break
+                if row[0] in member_ids:
+                    rows.append(row)
+            return rows, False
+
+        ranking = iter(db.rank_index)
+        scanned = 0
+        while len(rows) < count:
+            if scanned >= Settings.Leveling.lean_leaderboard_scan:
+                return rows[:count], True
+            batch = list(itertools.islice(ranking, members.QUERY_LIMIT))
+            if not batch:
+                break
+            scanned += len(batch)
+            in_guild = await members.guild_member_ids(
+                guild, [user_id for user_id, _ in batch]
+            )
+            rows.extend(row for row in batch if row[0] in in_guild)
+        return rows[:count], False
+
+    @commands.command(aliases=["lb", "top"])
+    async def leaderboard(self, ctx: commands.Context, scope: str = None):
+        """View the top players in this server, or everywhere with `global`."""
+        count = Settings.Leveling.leaderboard_size
+        if ctx.guild and scope != "global":
+            title = f"Leaderboard for {ctx.guild.name}"
+            rows, partial = await self.guild_top(ctx.guild, count)
+            if partial:
+                title += (
+                    f" (partial, only the top "
+                    f"{Settings.Leveling.lean_leaderboard_scan} players were checked)"
+                )
+        else:
+            title = "Global leaderboard"
+            rows = db.rank_index.top(count)
+
+        if not rows:
+            await ctx.send("Nobody is on the leaderboard yet.")
+            return
+
+        # show points as of now, not as of everyone's last action
+        now = int(time.time())
+        await db.prefetch_users(user_id for user_id, _ in rows)
+        projected = []
+        for user_id, points in rows:
+            db_user = await db.get_user(user_id)
+            if db_user:
+                points = projected_points(
+                    db_user.points, db_user.last_action_timestamp, now
+                )
+            projected.append((user_id, points))
+        rows = sorted(projected, key=lambda row: row[1], reverse=True)
+
+        lines = [f"**{title}**"]
+        for i, (user_id, points) in enumerate(rows, 1):
+            user = self.bot.get_user(user_id) or user_id
+            lines.append(
+                f"`#{i}` {user}: {points} points (level {calculate_level(points)})"
+            )
+        await ctx.send("\n".join(lines))
 
 
 def setup(bot: commands.Bot):
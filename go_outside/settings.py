@@ -19,20 +19,101 @@ class Settings:
     repo_url = "https://github.com/nwunderly/go-outside-bot"
 
     intents = disnake.Intents.all()
+    # Lean mode only uses the intents leveling needs and doesn't cache members,
+    # presences or chunk guilds. Members are fetched when a command needs them.
+    lean_mode = False
+    lean_intents = disnake.Intents(
+        guilds=True,
+        members=True,  # not cached, but needed to query members by ID
+        messages=True,
+        message_content=True,  # privileged, prefix commands need it
+        reactions=True,
+        typing=True,
+        voice_states=True,
+    )
+    # lean mode remembers member lookups for this long, see utils.members
+    member_cache_size = 100_000
+    member_cache_ttl = 600  # seconds
     help_command = commands.MinimalHelpCommand()
     allowed_mentions = disnake.AllowedMentions.none()
 
     cogs = [
-        "jishaku",
         "go_outside.cogs.admin",
         "go_outside.cogs.general",
         "go_outside.cogs.leveling",
     ]
+    # non-essential cogs, loaded in the background once the bot is ready
+    deferred_cogs = [
+        "jishaku",
+    ]
+    # log how long each phase of startup takes
+    profile_startup = False
 
     activity = disnake.Game("outside")
 
     class Leveling:
-        points_scaling = 1  # 1 for seconds, 3600 for hours
+        # 1 for seconds, 3600 for hours. Only used for a new database, after
+        # that the scaling stored in it wins, use the rescore command to change it
+        points_scaling = 1
+        coalesce_window = 1  # seconds to collect events before scoring them
+        queue_size = 100_000  # events, anything past this is dropped
+        leaderboard_size = 10
+        # max ranked users checked for a guild leaderboard in lean mode, where
+        # every 100 users is a gateway request
+        lean_leaderboard_scan = 1000
+        level_table_size = 10_000  # levels with precomputed thresholds
+        rescore_chunk_size = 10_000  # users per query when rescaling points
+        min_session = 60  # seconds, shorter gaps between actions aren't sessions
+        streak_session = 3600  # seconds outside needed for a day to count
+        session_history = 32  # recent sessions kept per user
+        session_days = 35  # daily totals kept per user
+        # let users opt in to DMs when they level up or reach a time-outside
+        # milestone, with the notify command
+        milestone_notifications = False
+        # seconds since last action: 1h, 6h, 12h, 1d, 2d, 1w
+        milestones = [3600, 6 * 3600, 12 * 3600, 86400, 2 * 86400, 7 * 86400]
+        level_notification_step = 10  # only announce every nth level
 
     class Database:
         batch_update_interval = 30  # seconds
+        batch_update_size = 5000  # flush early once this many users are pending
+        copy_flush = True  # use COPY for batch updates on postgres
+        # set a path to journal unwritten updates to disk, replayed on startup
+        journal_path = None
+        journal_sync_interval = 1  # seconds between fsyncs
+        user_cache_size = 100_000
+        config_cache_size = 10_000
+        # concurrent cache misses are merged into one query per window
+        batch_load_window = 0.002  # seconds
+        batch_load_size = 500  # IDs per query, sqlite allows at most 999
+        # postgres connection pool, per process and per connection (primary/replica)
+        pool_min_size = 1
+        pool_max_size = 10
+        statement_cache_size = 100  # set to 0 behind pgbouncer in transaction mode
+        connect_timeout = 10  # seconds
+        command_timeout = None  # seconds, None for no limit
+        list_users_page_size = 20
+        list_users_scan = 1000  # users checked per page when filtering by server
+        export_chunk_size = 10_000  # rows per query/write for export and import
+        register_chunk_size = 1000  # rows per INSERT when registering a whole guild
+
+    class Outbound:
+        # Discord allows about 5 messages per 5 seconds per channel
+        channel_messages = 5
+        channel_period = 5  # seconds
+        global_messages = 50  # per second
+        # sends per channel window that notifications can't use
+        reply_reserve = 2
+        max_length = 2000  # characters per message, for merged notifications
+        limit_cache_size = 10_000  # channels whose rate limit state is kept
+
+    class Metrics:
+        # set a port to serve Prometheus metrics over HTTP
+        host = "127.0.0.1"
+        port = None
+        loop_lag_interval = 1  # seconds
+
+    class Cluster:
+        socket_dir = "/tmp/go-outside"
+        # forwarded actions buffered per unreachable process before new ones are dropped
+        outbox_limit = 100_000
@@ -0,0 +1,141 @@
+"""Streaming export/import of the database.
+
+A dump is a gzipped NDJSON file holding each table in turn: a header line
+{"table": name, "columns": [...]} followed by one JSON array per row, with
+binary columns hex-encoded. Tables are read in keyset-paged chunks and written
+back in chunks through the bulk write paths, so memory use doesn't depend on
+table size. Compression and JSON encoding run in a thread.
+"""
+
+import asyncio
+import gzip
+import json
+import typing
+
+from loguru import logger
+from tortoise import Tortoise, fields
+from tortoise.models import Model
+
+from go_outside.settings import Settings
+from go_outside.utils import db
+from go_outside.utils.sessions import SessionStats
+from go_outside.utils.state import UserState
+
+# {name: (model, columns)}, the first column is the primary key
+TABLES: dict[str, tuple[type[Model], tuple[str, ...]]] = {
+    "config": (db.Config, ("guild_id", "prefix", "event_mask")),
+    "user": (db.User, UserState.columns),
+    "user_sessions": (db.UserSessions, SessionStats.columns),
+    "notifications": (db.Notifications, ("user_id", "channel_id")),
+    "scoring": (db.Scoring, ("id", "points_scaling")),
+}
+
+
+def _binary_columns(model: type[Model], columns: typing.Iterable[str]) -> set[str]:
+    return {
+        column
+        for column in columns
+        if isinstance(model._meta.fields_map[column], fields.BinaryField)
+    }
+
+
+def _write_rows(file, rows: list[tuple], indexes: list[int]):
+    lines = []
+    for row in rows:
+        if indexes:
+            row = list(row)
+            for i in indexes:
+                row[i] = row[i].hex()
+        lines.append(json.dumps(row, separators=(",", ":")))
+    file.write("\n".join(lines) + "\n")
+
+
+def _read_lines(file, count: int) -> list:
+    lines = []
+    for line in file:
+        lines.append(json.loads(line))
+        if len(lines) >= count:
+            break
+    return lines
+
+
+async def export_db(path: str) -> dict[str, int]:
+    """Write every table to a dump file. Returns the row count for each table."""
+    counts = {}
+    chunk_size = Settings.Database.export_chunk_size
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as file:
+        for name, (model, columns) in TABLES.items():
+            binary = _binary_columns(model, columns)
+            indexes = [i for i, column in enumerate(columns) if column in binary]
+            header = json.dumps({"table": name, "columns": list(columns)})
+            await asyncio.to_thread(file.write, header + "\n")
+            counts[name] = 0
+            async for rows in db.iter_rows(model, *columns[1:], chunk_size=chunk_size):
+                await asyncio.to_thread(_write_rows, file, rows, indexes)
+                counts[name] += len(rows)
+            logger.info(f"Exported {counts[name]} rows from {name}.")
+    return counts
+
+
+async def _import_rows(name: str, columns: list[str], rows: list[list]):
+    model, expected = TABLES[name]
+    # columns added since the dump was made get their defaults
+    present = [c for c in expected if c in columns]
+    rows = [dict(zip(columns, row)) for row in rows]
+    for column in _binary_columns(model, present):
+        for row in rows:
+            row[column] = bytes.fromhex(row[column])
+
+    if model is db.User:
+        db_users = [UserState.from_row([row[c] for c in expected]) for row in rows]
+        await db.write_users(db_users, set(expected[1:]), upsert=True)
+    else:
+        await db.upsert_rows(
+            model, present, [tuple(row[c] for c in present) for row in rows]
+        )
+
+
+async def import_db(path: str) -> dict[str, int]:
+    """Insert or update every row in a dump file. Returns the row count for each
+    table. Caches aren't touched, see db.reload."""
+    counts = {}
+    name = columns = None
+    chunk_size = Settings.Database.export_chunk_size
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        while lines := await asyncio.to_thread(_read_lines, file, chunk_size):
+            rows = []
+            for line in lines:
+                if isinstance(line, list):
+                    rows.append(line)
+                    continue
+                # header for the next table, write what we have of this one
+                if rows:
+                    await _import_rows(name, columns, rows)
+                    counts[name] += len(rows)
+                    rows = []
+                name, columns = line["table"], line["columns"]
+                if name not in TABLES:
+                    raise ValueError(f"Unknown table {name!r} in {path}.")
+                model, expected = TABLES[name]
+                missing = set(expected) - set(columns)
+                if missing and (model is db.User or expected[0] in missing):
+                    raise ValueError(f"Table {name} in {path} is missing {missing}.")
+                counts[name] = 0
+            if rows:
+                await _import_rows(name, columns, rows)
+                counts[name] += len(rows)
+    for name, count in counts.items():
+        logger.info(f"Imported {count} rows into {name}.")
+    return counts
+
+
+async def run(command: str, db_url: str, path: str):
+    """Entry point for `python -m go_outside export/import PATH`."""
+    await db.connect(db_url)
+    try:
+        if command == "export":
+            await export_db(path)
+        else:
+            await import_db(path)
+    finally:
+        await Tortoise.close_connections()
@@ -0,0 +1,87 @@
+import time
+import typing
+from collections import OrderedDict
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+_MISSING = object()
+# Most entries looked at per eviction. Without a bound, a cache that's mostly
+# pinned would scan every entry on every set().
+_EVICT_SCAN = 16
+
+
+class LRUCache(typing.Generic[K, V]):
+    """Size-bounded LRU cache with an optional TTL and hit/miss/eviction counters.
+
+    Keys for which `pinned(key)` returns True are never evicted, so the cache
+    can temporarily grow past maxsize if everything in it is pinned. Each set()
+    only looks at a few of the oldest entries, so the excess is evicted over
+    later sets once they're unpinned.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float | None = None,
+        pinned: typing.Callable[[K], bool] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.pinned = pinned
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._expires: dict[K, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: K):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: K, default=None, count=True):
+        """Get a value, marking it as recently used."""
+        value = self._data.get(key, _MISSING)
+        if value is not _MISSING and self.ttl and self._expires[key] < time.monotonic():
+            self.pop(key)
+            value = _MISSING
+        if value is _MISSING:
+            if count:
+                self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key: K, value: V):
+        """Set a value, evicting the least recently used entries if over maxsize."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.ttl:
+            self._expires[key] = time.monotonic() + self.ttl
+        if len(self._data) > self.maxsize:
+            self._evict()
+
+    def pop(self, key: K, default=None):
+        self._expires.pop(key, None)
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+        self._expires.clear()
+
+    def _evict(self):
+        # skip over (and refresh) pinned entries
+        for _ in range(_EVICT_SCAN):
+            if len(self._data) <= self.maxsize:
+                return
+            key = next(iter(self._data))
+            if self.pinned and self.pinned(key):
+                self._data.move_to_end(key)
+                continue
+            self.pop(key)
+            self.evictions += 1
+
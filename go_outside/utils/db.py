@@ -1,12 +1,22 @@
 import asyncio
 import time
+from typing import Callable, Iterable, Sequence
 
 import disnake
 from loguru import logger
-from tortoise import Tortoise, fields
+from tortoise import Tortoise, connections, fields
+from tortoise.transactions import in_transaction
+from tortoise.backends.base.config_generator import expand_db_url
 from tortoise.models import Model
 
 from go_outside.settings import Settings
+from go_outside.utils import metrics
+from go_outside.utils.cache import LRUCache
+from go_outside.utils.journal import Journal
+from go_outside.utils.loader import BatchLoader
+from go_outside.utils.ranking import RankIndex
+from go_outside.utils.sessions import SessionStats
+from go_outside.utils.state import UserState
 
 # async def edit_record(record: Model, **kwargs):
 #     """Edit a record. Handles database query and caching."""
@@ -24,19 +34,99 @@ class Config(Model):
 
     guild_id: int = fields.BigIntField(pk=True, generated=False)
     prefix: str = fields.TextField(default=Settings.prefix)
+    # event types that count in this guild, bit n is action id n
+    event_mask: int = fields.IntField(default=-1)
+
+
+# every bit set, so new event types count by default
+ALL_EVENTS = -1
+
+# Guild config cache.
+config_cache: LRUCache[int, "Config"] = LRUCache(
+    Settings.Database.config_cache_size
+)  # {guild_id: Config}
+# Prefix for every configured guild. Loaded at startup and kept in sync by
+# create_config/update_config, so prefix lookups never hit the database.
+prefixes: dict[int, str] = {}  # {guild_id: prefix}
+# Same for event masks, but only for guilds that don't count every event type.
+event_masks: dict[int, int] = {}  # {guild_id: event_mask}
+
+
+def remember_config(config: Config):
+    """Update the in-memory maps and cache after a config was created or changed."""
+    prefixes[config.guild_id] = config.prefix
+    if config.event_mask == ALL_EVENTS:
+        event_masks.pop(config.guild_id, None)
+    else:
+        event_masks[config.guild_id] = config.event_mask
+    config_cache.set(config.guild_id, config)
+
+
+def cache_metrics(name: str, cache: LRUCache):
+    """Expose a cache's counters as metrics."""
+    labels = {"cache": name}
+    for stat in ("hits", "misses", "evictions"):
+        metrics.CounterFunc(
+            f"go_outside_cache_{stat}_total",
+            f"Cache {stat}.",
+            lambda stat=stat: getattr(cache, stat),
+            labels,
+        )
+    metrics.Gauge("go_outside_cache_size", "Cache entries.", cache.__len__, labels)
+
+
+cache_metrics("config", config_cache)
+
+
+def loader_metrics(name: str, loader: BatchLoader):
+    """Expose a loader's counters as metrics."""
+    labels = {"loader": name}
+    metrics.CounterFunc(
+        "go_outside_loader_queries_total",
+        "Batched lookup queries.",
+        lambda: loader.queries,
+        labels,
+    )
+    metrics.CounterFunc(
+        "go_outside_loader_coalesced_total",
+        "Lookups that joined one already in flight.",
+        lambda: loader.coalesced,
+        labels,
+    )
+
 
+async def _fetch_configs(guild_ids: list[int]) -> dict[int, Config]:
+    found = {}
+    for config in await Config.filter(guild_id__in=guild_ids):
+        # prefer a config created while the query was running
+        found[config.guild_id] = config_cache.get(config.guild_id, count=False)
+        if found[config.guild_id] is None:
+            found[config.guild_id] = config
+            config_cache.set(config.guild_id, config)
+    for guild_id in guild_ids:
+        if guild_id not in found and guild_id not in config_cache:
+            prefixes.pop(guild_id, None)
+            event_masks.pop(guild_id, None)
+    return found
 
-# Guild config cache. Stores None for unconfigured guilds to reduce database queries.
-config_cache: dict[int, "Config"] = {}  # {guild_id: Config}
+
+config_loader: BatchLoader[int, Config] = BatchLoader(
+    _fetch_configs,
+    Settings.Database.batch_load_window,
+    Settings.Database.batch_load_size,
+)
+loader_metrics("config", config_loader)
 
 
 async def get_config(guild_id: int):
     "Get a guild config, if one exists. Return None otherwise."
-    if guild_id not in config_cache:
-        config = await Config.get_or_none(guild_id=guild_id)
-        config_cache[guild_id] = config
-        return config
-    return config_cache[guild_id]
+    # every configured guild is in the prefix map, so we only query for those
+    if guild_id not in prefixes:
+        return None
+    config = config_cache.get(guild_id)
+    if config is None:
+        config = await config_loader.load(guild_id)
+    return config
 
 
 async def create_config(guild_id):
@@ -45,7 +135,7 @@ async def create_config(guild_id):
     if config:
         return config, False
     config = await Config.create(guild_id=guild_id)
-    config_cache[guild_id] = config
+    remember_config(config)
     return config, True
 
 
@@ -54,15 +144,7 @@ async def update_config(config: Config, **kwargs):
     for key, value in kwargs.items():
         setattr(config, key, value)
     await config.save()
-    config_cache[config.guild_id] = config
-
-
-# user_id: (action, timestamp)
-# self.last_action_cache: dict[int, tuple[str, float]] = {}
-# user_id: duration
-# self.personal_best_cache: dict[int, int] = {}
-# user_id: points
-# self.points_cache: dict[int, int] = {}
+    remember_config(config)
 
 
 class User(Model):
@@ -75,83 +157,836 @@ class User(Model):
     points: int = fields.BigIntField()
 
 
+class UserSessions(Model):
+    """Table in database storing per-user session summaries, see SessionStats."""
+
+    user_id: int = fields.BigIntField(pk=True, generated=False)
+    streak: int = fields.IntField()
+    streak_day: int = fields.IntField()
+    recent: bytes = fields.BinaryField()
+    recent_pos: int = fields.IntField()
+    day: int = fields.IntField()
+    days: bytes = fields.BinaryField()
+    week: int = fields.IntField()
+    week_total: int = fields.BigIntField()
+    week_longest: int = fields.BigIntField()
+    month: int = fields.IntField()
+    month_total: int = fields.BigIntField()
+    month_longest: int = fields.BigIntField()
+
+
+class Notifications(Model):
+    """Table in database storing users who opted in to milestone DMs."""
+
+    user_id: int = fields.BigIntField(pk=True, generated=False)
+    channel_id: int = fields.BigIntField()  # their DM channel
+
+
+class Scoring(Model):
+    """Single-row table storing the points scaling that stored points use."""
+
+    id: int = fields.IntField(pk=True, generated=False)
+    points_scaling: int = fields.IntField()
+    # while points are being rescaled, the scaling they're rescaled to and the
+    # last user ID already rescaled, so an interrupted pass can be finished
+    rescale_to: int | None = fields.IntField(null=True)
+    rescaled_through: int | None = fields.BigIntField(null=True)
+
+
+# IDs of every user that has opted in. Loaded at startup and kept in sync by
+# create_user/delete_user, so events from anyone else never touch the database.
+registered_ids: set[int] = set()
+# Every registered user ordered by points, rebuilt at startup and kept in sync by
+# create_user/update_user/delete_user.
+rank_index = RankIndex()
+# DM channel of every user that opted in to milestone DMs. Loaded at startup and
+# kept in sync by set_notifications, so sending a DM never needs an HTTP call.
+notify_channels: dict[int, int] = {}  # {user_id: channel_id}
+# In cluster mode, whether this process owns a user (see go_outside.cluster).
+# Only owned users are cached, anyone else is read fresh from the database.
+owns: Callable[[int], bool] = lambda user_id: True
+# In cluster mode, called with (user_id, old points, new points) when an owned
+# user's points change, to keep the other processes' rank indexes current.
+points_changed: Callable[[int, int, int], None] | None = None
+# Points that other processes' users have in the rank index, if they changed
+# since startup. Their rows in the database lag behind until the next flush.
+indexed_points: LRUCache[int, int] = LRUCache(
+    Settings.Database.user_cache_size
+)  # {user_id: points}
+
+
 class UserCache:
-    """Database caching for the User table."""
+    """Database caching for the User table. Users are cached as compact
+    UserState records, ORM objects are only built when writing."""
 
-    # actual user cache
-    user_cache: dict[int, "User"] = {}  # {user_id: User}
+    # actual user cache, users with unwritten changes are never evicted
+    user_cache: LRUCache[int, UserState] = LRUCache(
+        Settings.Database.user_cache_size,
+        pinned=lambda user_id: user_id in UserCache.batch_update_records
+        or user_id in UserCache.flushing_records,
+    )  # {user_id: UserState}
 
     # cache for batch updates
     last_batch_update: int = 0
     # User records that need to be updated
-    batch_update_records: list["User"] = []
+    batch_update_records: dict[int, UserState] = {}  # {user_id: UserState}
+    # User records currently being written by a batch update
+    flushing_records: dict[int, UserState] = {}  # {user_id: UserState}
     # fields that have been updated across all records
     batch_update_fields: set[str] = set()
 
 
-async def get_user(user_id: int):
-    "Get a User, if it exists. Return None otherwise."
-    if user_id not in UserCache.user_cache:
-        db_user = await User.get_or_none(user_id=user_id)
-        UserCache.user_cache[user_id] = db_user
-        return db_user
-    return UserCache.user_cache[user_id]
+cache_metrics("user", UserCache.user_cache)
+metrics.Gauge(
+    "go_outside_registered_users", "Registered users.", registered_ids.__len__
+)
+metrics.Gauge(
+    "go_outside_dirty_users",
+    "Users waiting for the next batch update.",
+    lambda: len(UserCache.batch_update_records),
+)
+batch_sizes = metrics.Histogram(
+    "go_outside_batch_update_users",
+    "Users written per batch update.",
+    [10, 100, 1000, 5000, 10_000, 50_000, 100_000],
+)
+# {backend: histogram}, see write_users
+batch_durations = {
+    backend: metrics.Histogram(
+        "go_outside_batch_update_seconds",
+        "Time taken by batch updates.",
+        metrics.LATENCY_BUCKETS,
+        {"backend": backend},
+    )
+    for backend in ("copy", "orm")
+}
+
+
+class SessionCache:
+    """Database caching for the UserSessions table."""
+
+    session_cache: LRUCache[int, SessionStats] = LRUCache(
+        Settings.Database.user_cache_size,
+        pinned=lambda user_id: user_id in SessionCache.batch_update_records
+        or user_id in SessionCache.flushing_records,
+    )  # {user_id: SessionStats}
+    # SessionStats that need to be written
+    batch_update_records: dict[int, SessionStats] = {}  # {user_id: SessionStats}
+    # SessionStats currently being written by a batch update
+    flushing_records: dict[int, SessionStats] = {}  # {user_id: SessionStats}
+
+
+cache_metrics("sessions", SessionCache.session_cache)
+
+
+async def _fetch_users(user_ids: list[int]) -> dict[int, UserState]:
+    # users we own are written back from the cache, so they must be read from the
+    # primary. other processes' users are only read, a replica is fine for them.
+    owned = [user_id for user_id in user_ids if owns(user_id)]
+    others = [user_id for user_id in user_ids if not owns(user_id)]
+    rows = []
+    if owned:
+        rows += await User.filter(user_id__in=owned).values_list(*UserState.columns)
+    if others:
+        replica_rows = (
+            await User.filter(user_id__in=others)
+            .using_db(read_db())
+            .values_list(*UserState.columns)
+        )
+        rows += replica_rows
+        # a lagging replica may not have new users yet, only trust the primary
+        # to say a user doesn't exist
+        seen = {row[0] for row in replica_rows}
+        lagging = [user_id for user_id in others if user_id not in seen]
+        if lagging and has_replica:
+            rows += await User.filter(user_id__in=lagging).values_list(
+                *UserState.columns
+            )
+    found = {}
+    for row in rows:
+        user_id = row[0]
+        # prefer a user created or updated while the query was running
+        db_user = UserCache.user_cache.get(user_id, count=False)
+        if db_user is None:
+            db_user = UserState.from_row(row)
+            if owns(user_id):
+                UserCache.user_cache.set(user_id, db_user)
+        found[user_id] = db_user
+    for user_id in user_ids:
+        if user_id not in found:
+            db_user = UserCache.user_cache.get(user_id, count=False)
+            if db_user is None:
+                registered_ids.discard(user_id)
+            else:
+                found[user_id] = db_user
+    return found
+
+
+user_loader: BatchLoader[int, UserState] = BatchLoader(
+    _fetch_users,
+    Settings.Database.batch_load_window,
+    Settings.Database.batch_load_size,
+)
+loader_metrics("user", user_loader)
+
+
+async def get_user(user_id: int) -> UserState | None:
+    "Get a user's state, if they're registered. Return None otherwise."
+    if user_id not in registered_ids:
+        return None
+    db_user = UserCache.user_cache.get(user_id)
+    if db_user is None:
+        db_user = await user_loader.load(user_id)
+    return db_user
 
 
-async def create_user(user_id: int) -> User:
-    """Create a user."""
-    db_user = await User.create(
+async def prefetch_users(user_ids: Iterable[int]):
+    """Load uncached users concurrently, so they're fetched in batches."""
+    await asyncio.gather(
+        *(
+            get_user(user_id)
+            for user_id in user_ids
+            if user_id in registered_ids and user_id not in UserCache.user_cache
+        )
+    )
+
+
+async def create_user(user_id: int) -> tuple[UserState, bool]:
+    """Create a user. Returns the existing user if they're already registered."""
+    db_user = await get_user(user_id)
+    if db_user:
+        return db_user, False
+    db_user = UserState(
         user_id=user_id,
-        last_action_type="message_create",
-        last_action_timestamp=time.time(),
-        personal_best=0,
         points=0,
+        last_action_timestamp=int(time.time()),
+        last_action_type=0,
+        personal_best=0,
     )
-    UserCache.user_cache[user_id] = db_user
-    return db_user
+    await User.create(**db_user.to_dict())
+    mark_registered(user_id)
+    if owns(user_id):
+        UserCache.user_cache.set(user_id, db_user)
+    return db_user, True
+
+
+async def create_users(user_ids: list[int]) -> list[int]:
+    """Register many users at once, skipping ones that already are.
+    Returns the IDs that were newly registered.
+
+    Rows are inserted in one multi-row INSERT per chunk, ignoring conflicts. New
+    users aren't cached, most of them won't be active any time soon.
+    """
+    new_ids = [
+        user_id for user_id in dict.fromkeys(user_ids) if user_id not in registered_ids
+    ]
+    now = int(time.time())
+    size = Settings.Database.register_chunk_size
+    for i in range(0, len(new_ids), size):
+        chunk = new_ids[i : i + size]
+        await User.bulk_create(
+            [
+                User(**UserState(user_id, 0, now, 0, 0).to_dict())
+                for user_id in chunk
+            ],
+            ignore_conflicts=True,
+        )
+        for user_id in chunk:
+            mark_registered(user_id)
+    return new_ids
+
+
+async def delete_user(user_id: int):
+    """Delete a user and drop them from the cache."""
+    forget_user(user_id, await get_user(user_id))
+    await delete_rows(user_id)
+
+
+async def delete_rows(user_id: int):
+    """Delete a user's rows. Waits for a batch update in progress, which may
+    still write them after they were dropped from the cache."""
+    async with user_update_lock:
+        await User.filter(user_id=user_id).delete()
+        await UserSessions.filter(user_id=user_id).delete()
+        await Notifications.filter(user_id=user_id).delete()
+
+
+async def get_sessions(user_id: int) -> SessionStats | None:
+    """Get a user's session summaries. Return None if they aren't registered."""
+    if user_id not in registered_ids:
+        return None
+    stats = SessionCache.session_cache.get(user_id)
+    if stats is None:
+        rows = await UserSessions.filter(user_id=user_id).values(
+            *SessionStats.columns
+        )
+        stats = SessionStats.from_row(rows[0]) if rows else SessionStats(user_id)
+        if owns(user_id):
+            SessionCache.session_cache.set(user_id, stats)
+    return stats
+
+
+async def set_notifications(user_id: int, channel_id: int | None):
+    """Opt a user in to milestone DMs in a channel, or out with None."""
+    if channel_id is None:
+        await Notifications.filter(user_id=user_id).delete()
+    else:
+        await Notifications.update_or_create(
+            user_id=user_id, defaults={"channel_id": channel_id}
+        )
+    remember_notifications(user_id, channel_id)
+
+
+def remember_notifications(user_id: int, channel_id: int | None):
+    """Update notify_channels, without touching the database."""
+    if channel_id is None:
+        notify_channels.pop(user_id, None)
+    else:
+        notify_channels[user_id] = channel_id
+
+
+def record_session(stats: SessionStats, length: int, end: int):
+    """Add a finished inactivity session to a user's summaries."""
+    stats.record(length, end)
+    SessionCache.batch_update_records[stats.user_id] = stats
 
 
-async def update_user(db_user: User, **kwargs):
-    """Update a user. Handles caching and bulk updates."""
-    # NOTE: maybe use a set to track IDs if this starts getting big and slow
-    if db_user not in UserCache.batch_update_records:
-        UserCache.batch_update_records.append(db_user)
+def mark_registered(user_id: int):
+    """Track a newly registered user, whose row has already been created."""
+    if user_id not in registered_ids:
+        registered_ids.add(user_id)
+        rank_index.add(user_id, 0)
+
+
+def forget_user(user_id: int, db_user: UserState = None):
+    """Drop a user from memory, without touching the database."""
+    db_user = UserCache.user_cache.pop(user_id) or db_user
+    UserCache.batch_update_records.pop(user_id, None)
+    SessionCache.session_cache.pop(user_id)
+    SessionCache.batch_update_records.pop(user_id, None)
+    indexed_points.pop(user_id)
+    notify_channels.pop(user_id, None)
+    if user_id in registered_ids:
+        registered_ids.discard(user_id)
+        if not (db_user and rank_index.remove(user_id, db_user.points)):
+            rank_index.discard(user_id)
+
+
+def apply_points(user_id: int, old_points: int, new_points: int):
+    """Apply a change to another process's user's points to the rank index."""
+    if user_id not in registered_ids:
+        return
+    if not rank_index.remove(user_id, old_points):
+        # e.g. this process loaded the index before a flush the owner had done
+        rank_index.discard(user_id)
+    rank_index.add(user_id, new_points)
+    indexed_points.set(user_id, new_points)
+
+
+def rank_position(db_user: UserState) -> int | None:
+    """A user's position in the rank index, None if it can't be found."""
+    points = db_user.points
+    if not owns(db_user.user_id):
+        points = indexed_points.get(db_user.user_id, points, count=False)
+    return rank_index.position(db_user.user_id, points)
+
+
+def update_user(db_user: UserState, **kwargs):
+    """Update a user. Handles caching and marks the user for the next batch update."""
+    UserCache.batch_update_records[db_user.user_id] = db_user
+
+    if "points" in kwargs:
+        rank_index.update(db_user.user_id, db_user.points, kwargs["points"])
+        if points_changed:
+            points_changed(db_user.user_id, db_user.points, kwargs["points"])
 
     for key, value in kwargs.items():
         setattr(db_user, key, value)
         UserCache.batch_update_fields.add(key)
 
-    if (
-        time.time() - UserCache.last_batch_update
-        >= Settings.Database.batch_update_interval
-    ):
-        # if a batch update is ongoing, don't queue a new one
-        if not user_update_lock.locked():
-            await batch_update_users()
+    if journal:
+        journal.append(
+            db_user.user_id,
+            db_user.points,
+            db_user.last_action_timestamp,
+            db_user.last_action_type,
+        )
+
+    # wake the flusher early if the batch is getting big
+    if len(UserCache.batch_update_records) >= Settings.Database.batch_update_size:
+        flush_requested.set()
 
 
 user_update_lock = asyncio.Lock()
+flush_requested = asyncio.Event()
+flusher_task: asyncio.Task | None = None
+# crash-safe log of unwritten updates, if Settings.Database.journal_path is set
+journal: Journal | None = None
+journal_task: asyncio.Task | None = None
 
 
 async def batch_update_users():
     """Run a bulk update on all the Users in the user_update_queue and reset the queue."""
     async with user_update_lock:
-        # pull the cache/queue
-        cached_objects = UserCache.batch_update_records
-        cached_fields = UserCache.batch_update_fields
-        logger.info(
-            f"Executing batch update | {len(cached_objects)} users, {cached_fields=}"
+        await _flush_users()
+        await _flush_sessions()
+
+
+async def _flush_users():
+    # pull the cache/queue, anything updated from here on goes in the next batch
+    cached_objects = UserCache.batch_update_records
+    cached_fields = UserCache.batch_update_fields
+    UserCache.batch_update_records = {}
+    UserCache.batch_update_fields = set()
+    if not cached_objects:
+        return
+    UserCache.flushing_records = cached_objects
+    # updates from here on go in the next segment
+    segment = journal.rotate() if journal else None
+
+    logger.info(
+        f"Executing batch update | {len(cached_objects)} users, {cached_fields=}"
+    )
+    try:
+        if journal:
+            # the old segment must be on disk before the batch is written
+            await asyncio.to_thread(journal.sync)
+        await write_users(list(cached_objects.values()), cached_fields)
+    except BaseException:
+        # put the records back so they get retried on the next flush
+        cached_objects.update(UserCache.batch_update_records)
+        UserCache.batch_update_records = cached_objects
+        UserCache.batch_update_fields |= cached_fields
+        raise
+    finally:
+        UserCache.flushing_records = {}
+
+    if journal:
+        await asyncio.to_thread(journal.commit, segment)
+    batch_sizes.observe(len(cached_objects))
+    UserCache.last_batch_update = time.time()
+
+
+async def _flush_sessions():
+    cached_objects = SessionCache.batch_update_records
+    SessionCache.batch_update_records = {}
+    if not cached_objects:
+        return
+    SessionCache.flushing_records = cached_objects
+
+    # snapshot before awaiting, the stats keep changing while we write
+    rows = []
+    for stats in cached_objects.values():
+        row = stats.to_dict()
+        rows.append(tuple(row[column] for column in SessionStats.columns))
+    try:
+        await upsert_rows(UserSessions, SessionStats.columns, rows)
+    except BaseException:
+        cached_objects.update(SessionCache.batch_update_records)
+        SessionCache.batch_update_records = cached_objects
+        raise
+    finally:
+        SessionCache.flushing_records = {}
+
+
+async def upsert_rows(model: type[Model], columns: Sequence[str], rows: list[tuple]):
+    """Insert rows of values for `columns`, the first being the primary key,
+    updating the rows that already exist.
+
+    bulk_create(on_conflict=...) can't be used for this: tortoise 0.20 adds the
+    ON CONFLICT clause twice for models without generated fields, which both
+    SQLite and Postgres reject. So the statement is written out here.
+    """
+    conn = connections.get("default")
+    if conn.capabilities.dialect == "postgres":
+        params = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    else:
+        params = ", ".join("?" for _ in columns)
+    if len(columns) > 1:
+        excluded = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+        action = f"DO UPDATE SET {excluded}"
+    else:
+        action = "DO NOTHING"
+    query = (
+        f'INSERT INTO "{model._meta.db_table}" ({", ".join(columns)}) '
+        f"VALUES ({params}) ON CONFLICT ({columns[0]}) {action}"
+    )
+    for i in range(0, len(rows), 1000):
+        await conn.execute_many(query, rows[i : i + 1000])
+
+
+async def write_users(
+    db_users: list[UserState], fields: set[str], upsert: bool = False
+):
+    """Write the given fields of a list of users to the database.
+
+    On Postgres, rows are streamed into a temp table with COPY and applied with a
+    single UPDATE ... FROM. Otherwise falls back to the ORM's bulk_update.
+    With `upsert`, missing users are inserted, so `fields` must be every column
+    other than user_id.
+    """
+    conn = connections.get("default")
+    start = time.perf_counter()
+    if conn.capabilities.dialect == "postgres" and Settings.Database.copy_flush:
+        backend = "copy"
+        await copy_update_users(conn, db_users, fields, upsert)
+    elif upsert:
+        backend = "orm"
+        columns = ["user_id", *sorted(fields - {"user_id"})]
+        rows = []
+        for db_user in db_users:
+            row = db_user.to_dict()
+            rows.append(tuple(row[column] for column in columns))
+        await upsert_rows(User, columns, rows)
+    else:
+        backend = "orm"
+        await User.bulk_update(
+            [User(**db_user.to_dict()) for db_user in db_users], fields
+        )
+    duration = time.perf_counter() - start
+    batch_durations[backend].observe(duration)
+    logger.debug(f"Wrote {len(db_users)} users with {backend} in {duration:.3f}s")
+
+
+async def copy_update_users(
+    conn, db_users: list[UserState], fields: set[str], upsert: bool = False
+):
+    """Update (or with `upsert`, insert or update) users on Postgres using COPY
+    into a temp table."""
+    table = User._meta.db_table
+    columns = ["user_id", *sorted(fields - {"user_id"})]
+    records = []
+    for db_user in db_users:
+        row = db_user.to_dict()
+        records.append(tuple(row[column] for column in columns))
+
+    column_list = ", ".join(columns)
+    assignments = ", ".join(f"{column} = f.{column}" for column in columns[1:])
+    async with conn.acquire_connection() as con:
+        async with con.transaction():
+            await con.execute(
+                f"CREATE TEMP TABLE user_flush ON COMMIT DROP AS "
+                f'SELECT {column_list} FROM "{table}" WITH NO DATA'
+            )
+            await con.copy_records_to_table(
+                "user_flush", records=records, columns=columns
+            )
+            if upsert:
+                excluded = ", ".join(
+                    f"{column} = EXCLUDED.{column}" for column in columns[1:]
+                )
+                await con.execute(
+                    f'INSERT INTO "{table}" ({column_list}) '
+                    f"SELECT {column_list} FROM user_flush "
+                    f"ON CONFLICT (user_id) DO UPDATE SET {excluded}"
+                )
+            else:
+                await con.execute(
+                    f'UPDATE "{table}" u SET {assignments} '
+                    f"FROM user_flush f WHERE u.user_id = f.user_id"
+                )
+
+
+async def flusher():
+    """Background task writing dirty users to the database, either every
+    batch_update_interval seconds or as soon as batch_update_size is hit."""
+    while True:
+        try:
+            await asyncio.wait_for(
+                flush_requested.wait(), Settings.Database.batch_update_interval
+            )
+        except asyncio.TimeoutError:
+            pass
+        flush_requested.clear()
+        try:
+            await batch_update_users()
+        except Exception:
+            logger.exception("Batch update failed, will retry on next flush.")
+
+
+async def journal_syncer():
+    """Background task fsyncing the journal in batches, in a thread so the
+    event loop doesn't wait on the disk."""
+    while True:
+        await asyncio.sleep(Settings.Database.journal_sync_interval)
+        await asyncio.to_thread(journal.sync)
+
+
+def start_flusher():
+    """Start the background flusher task."""
+    global flusher_task, journal_task
+    flusher_task = asyncio.create_task(flusher())
+    if journal:
+        journal_task = asyncio.create_task(journal_syncer())
+
+
+async def stop_flusher():
+    """Stop the background flusher task and write any pending updates."""
+    global flusher_task, journal_task
+    for task in (flusher_task, journal_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    flusher_task = journal_task = None
+    try:
+        await batch_update_users()
+    except Exception:
+        logger.exception(
+            f"Final batch update failed, "
+            f"{len(UserCache.batch_update_records)} users not written."
+        )
+    if journal:
+        journal.close()
+
+
+# Set by init if a read replica is configured.
+has_replica = False
+
+
+def connection_config(db_url: str) -> dict:
+    """Tortoise connection config for a URL, with pool settings applied.
+    Settings given in the URL's query string take precedence."""
+    config = expand_db_url(db_url)
+    if config["engine"] == "tortoise.backends.asyncpg":
+        credentials = config["credentials"]
+        credentials.setdefault("minsize", Settings.Database.pool_min_size)
+        credentials.setdefault("maxsize", Settings.Database.pool_max_size)
+        credentials.setdefault(
+            "statement_cache_size", Settings.Database.statement_cache_size
         )
-        await User.bulk_update(cached_objects, cached_fields)
+        credentials.setdefault("timeout", Settings.Database.connect_timeout)
+        credentials.setdefault("command_timeout", Settings.Database.command_timeout)
+    return config
+
+
+def read_db():
+    """Connection for reads that may lag slightly behind, the replica if there is one.
+    Returns None (the default connection) otherwise."""
+    return connections.get("replica") if has_replica else None
 
-        # empty the cache/queue, update timer
-        UserCache.batch_update_records = []
-        UserCache.batch_update_fields = set()
-        UserCache.last_batch_update = time.time()
 
+async def init(db_url: str, replica_url: str = None):
+    """Connect to the database and load the state the bot keeps in memory."""
+    await connect(db_url, replica_url)
+    if Settings.Database.journal_path:
+        await replay_journal(Settings.Database.journal_path)
+    await load_scaling()
+    await load_configs()
+    await load_users()
+    await load_notifications()
+    await resume_rescale()
 
-async def init(db_url: str):
-    """Connect to the database."""
+
+async def connect(db_url: str, replica_url: str = None):
+    """Connect to the database, and the read replica if given."""
+    global has_replica
     logger.info("Connecting to database.")
-    await Tortoise.init(db_url=db_url, modules={"models": ["go_outside.utils.db"]})
+    db_connections = {"default": connection_config(db_url)}
+    if replica_url:
+        logger.info("Routing read-only queries to the replica.")
+        db_connections["replica"] = connection_config(replica_url)
+    has_replica = bool(replica_url)
+    await Tortoise.init(
+        config={
+            "connections": db_connections,
+            "apps": {
+                "models": {
+                    "models": ["go_outside.utils.db"],
+                    "default_connection": "default",
+                }
+            },
+        }
+    )
     # await Tortoise.generate_schemas()
+
+
+async def iter_rows(
+    model: type[Model],
+    *columns: str,
+    chunk_size: int = 10_000,
+    after: int = None,
+    replica: bool = False,
+    **filters,
+):
+    """Stream (pk, *columns) rows from a table in chunks, using keyset
+    pagination so memory stays constant regardless of table size.
+    Starts after primary key `after` if given. With `replica`, reads from the read
+    replica if there is one, so rows may be slightly behind."""
+    pk = model._meta.pk_attr
+    last_id = after
+    while True:
+        query = model.filter(**filters).using_db(read_db() if replica else None)
+        if last_id is not None:
+            query = query.filter(**{f"{pk}__gt": last_id})
+        rows = await query.order_by(pk).limit(chunk_size).values_list(pk, *columns)
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def iter_user_rows(*columns: str, **kwargs):
+    """Stream (user_id, *columns) rows from the User table, see iter_rows."""
+    return iter_rows(User, *columns, **kwargs)
+
+
+async def rescale_points(points_scaling: int):
+    """Rescale every user's points to a new points scaling, and store it.
+
+    Pending updates are flushed first, then the table is rescaled in
+    keyset-paged chunks through the bulk write path, so rows are never loaded
+    as ORM objects. Each chunk is written in the same transaction as the last
+    user ID it rescaled, so a pass that was interrupted is finished from there
+    (see resume_rescale) without rescaling anyone twice. The caller must make
+    sure nothing updates users while this runs. Commands can still read users,
+    so the cache is dropped again at the end, in case a read cached a row
+    before its chunk was rescaled.
+    """
+    await batch_update_users()
+    UserCache.user_cache.clear()
+    scoring = await Scoring.get(id=1)
+    if scoring.rescale_to is None:
+        scoring.rescale_to = points_scaling
+        await scoring.save(update_fields=["rescale_to"])
+    elif scoring.rescale_to != points_scaling:
+        # finish the interrupted pass first, its chunks are already mixed in
+        await rescale_points(scoring.rescale_to)
+        scoring = await Scoring.get(id=1)
+        scoring.rescale_to = points_scaling
+        await scoring.save(update_fields=["rescale_to"])
+
+    # points are (seconds // scaling) ** 2
+    numerator = scoring.points_scaling**2
+    denominator = points_scaling**2
+    through = scoring.rescaled_through
+    ranks = []
+    async for rows in iter_user_rows(
+        "points", chunk_size=Settings.Leveling.rescore_chunk_size
+    ):
+        db_users = []
+        for user_id, points in rows:
+            if through is not None and user_id <= through:
+                # rescaled before the pass was interrupted
+                ranks.append((user_id, points))
+            else:
+                db_users.append(
+                    UserState(user_id, points * numerator // denominator, 0, 0, 0)
+                )
+        if not db_users:
+            continue
+        async with in_transaction():
+            await write_users(db_users, {"points"})
+            await Scoring.filter(id=1).update(rescaled_through=db_users[-1].user_id)
+        ranks.extend((db_user.user_id, db_user.points) for db_user in db_users)
+    await Scoring.filter(id=1).update(
+        points_scaling=points_scaling, rescale_to=None, rescaled_through=None
+    )
+    Settings.Leveling.points_scaling = points_scaling
+    UserCache.user_cache.clear()
+
+    # users registered or deleted since their chunk was read
+    seen = {user_id for user_id, _ in ranks}
+    ranks = [
+        (user_id, points) for user_id, points in ranks if user_id in registered_ids
+    ]
+    ranks.extend((user_id, 0) for user_id in registered_ids if user_id not in seen)
+    rank_index.rebuild(ranks)
+    logger.info(
+        f"Rescaled points for {len(ranks)} users from {scoring.points_scaling} "
+        f"to {points_scaling}."
+    )
+
+
+async def resume_rescale():
+    """Finish rescaling points if a previous run stopped partway through."""
+    scoring = await Scoring.get(id=1)
+    if scoring.rescale_to is not None:
+        logger.warning(
+            f"Rescaling points to {scoring.rescale_to} was interrupted, finishing it."
+        )
+        await rescale_points(scoring.rescale_to)
+
+
+async def load_scaling():
+    """Use the points scaling stored in the database, which the stored points
+    were computed with. Stores the configured one if there isn't one yet."""
+    scoring = await Scoring.get_or_none(id=1)
+    if scoring is None:
+        await Scoring.create(id=1, points_scaling=Settings.Leveling.points_scaling)
+    elif scoring.points_scaling != Settings.Leveling.points_scaling:
+        logger.warning(
+            f"Points scaling is {scoring.points_scaling} in the database but "
+            f"{Settings.Leveling.points_scaling} in settings, using "
+            f"{scoring.points_scaling}. Use the rescore command to change it."
+        )
+        Settings.Leveling.points_scaling = scoring.points_scaling
+
+
+async def replay_journal(path: str):
+    """Open the journal and write any updates a previous run didn't get to."""
+    global journal
+    journal = Journal(path)
+    latest = journal.replay()
+    if not latest:
+        return
+    logger.info(f"Replaying {len(latest)} users from journal.")
+    db_users = [
+        UserState(user_id, points, timestamp, action, 0)
+        for user_id, (points, timestamp, action) in latest.items()
+    ]
+    await write_users(
+        db_users, {"points", "last_action_timestamp", "last_action_type"}
+    )
+    journal.commit(journal.seq - 1)
+
+
+async def reload():
+    """Drop cached rows and reload prefixes, registered IDs and the rank index,
+    after the tables were changed behind the caches' back.
+    Pending updates must be flushed first."""
+    UserCache.user_cache.clear()
+    SessionCache.session_cache.clear()
+    indexed_points.clear()
+    config_cache.clear()
+    prefixes.clear()
+    event_masks.clear()
+    registered_ids.clear()
+    notify_channels.clear()
+    await load_scaling()
+    await load_configs()
+    await load_users()
+    await load_notifications()
+
+
+async def load_configs():
+    """Load every guild's prefix and event mask in one query."""
+    for guild_id, prefix, event_mask in await Config.all().values_list(
+        "guild_id", "prefix", "event_mask"
+    ):
+        prefixes[guild_id] = prefix
+        if event_mask != ALL_EVENTS:
+            event_masks[guild_id] = event_mask
+    logger.info(f"Loaded {len(prefixes)} guild configs.")
+
+
+async def load_users():
+    """Load registered IDs and the rank index in one streaming pass over the User table."""
+    ranks = []
+    async for rows in iter_user_rows("points"):
+        for user_id, points in rows:
+            registered_ids.add(user_id)
+            ranks.append((user_id, points))
+    rank_index.rebuild(ranks)
+    logger.info(f"Loaded {len(registered_ids)} registered users.")
+
+
+async def load_notifications():
+    """Load every opted-in user's DM channel in one query."""
+    for user_id, channel_id in await Notifications.all().values_list(
+        "user_id", "channel_id"
+    ):
+        notify_channels[user_id] = channel_id
+    logger.info(f"Loaded {len(notify_channels)} users with milestone DMs on.")
@@ -0,0 +1,20 @@
+"""Compact records for user actions, built straight from raw gateway payloads."""
+
+# first millisecond of 2015, snowflakes count from here
+DISCORD_EPOCH = 1420070400000
+
+
+def snowflake_time(snowflake: int) -> int:
+    """Unix time in seconds that a snowflake ID was created."""
+    return ((snowflake >> 22) + DISCORD_EPOCH) // 1000
+
+
+class Event:
+    """An action by a user, as queued for scoring."""
+
+    __slots__ = ("user_id", "action", "timestamp")
+
+    def __init__(self, user_id: int, action: int, timestamp: int):
+        self.user_id = user_id
+        self.action = action  # id from state.action_id
+        self.timestamp = timestamp
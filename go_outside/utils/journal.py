@@ -0,0 +1,114 @@
+import glob
+import os
+import struct
+import threading
+import typing
+from collections import deque
+
+from loguru import logger
+
+# user_id, points, last_action_timestamp, last_action_type
+RECORD = struct.Struct("<QqqH")
+
+
+class Journal:
+    """Append-only log of user updates that haven't been written to the database.
+
+    The journal is split into numbered segments (path.0, path.1, ...). A batch
+    update rotates to a new segment when it starts and deletes the old ones once
+    it succeeds, so a crash at any point leaves every unwritten update on disk.
+
+    Appends only go to an in-memory buffer. sync() writes and fsyncs it, and is
+    meant to run in a thread: buffers are handed over under a lock and written
+    in order, so appends and rotations can carry on meanwhile.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.seq = max(self.segments(), default=-1) + 1
+        self.file = open(self.segment_path(self.seq), "ab")
+        self.buffer = bytearray()
+        # (file, data, close after writing), oldest first
+        self.pending: deque[tuple[typing.BinaryIO, bytearray, bool]] = deque()
+        self.lock = threading.Lock()  # guards buffer, pending, file and seq
+        self.io_lock = threading.Lock()  # held while writing pending buffers
+
+    def segment_path(self, seq: int) -> str:
+        return f"{self.path}.{seq}"
+
+    def segments(self) -> list[int]:
+        """Sequence numbers of the segments on disk, oldest first."""
+        seqs = []
+        for name in glob.glob(glob.escape(self.path) + ".*"):
+            suffix = name.rpartition(".")[2]
+            if suffix.isdigit():
+                seqs.append(int(suffix))
+        return sorted(seqs)
+
+    def append(self, user_id: int, points: int, timestamp: int, action: int):
+        record = RECORD.pack(user_id, points, timestamp, action)
+        with self.lock:
+            self.buffer += record
+
+    def _seal(self, close: bool = False):
+        # caller holds self.lock
+        self.pending.append((self.file, self.buffer, close))
+        self.buffer = bytearray()
+
+    def sync(self):
+        """Write buffered records and fsync them to disk. Blocks on the disk."""
+        with self.lock:
+            self._seal()
+        # whoever holds io_lock writes everything pending, in order, so once we
+        # get it our records are on disk
+        with self.io_lock:
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        return
+                    file, data, close = self.pending.popleft()
+                if data:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                if close:
+                    file.close()
+
+    def rotate(self) -> int:
+        """Start a new segment, records appended from now on go to it. Returns
+        the sequence number of the old one, which is on disk after the next sync."""
+        with self.lock:
+            self._seal(close=True)
+            old = self.seq
+            self.seq += 1
+            self.file = open(self.segment_path(self.seq), "ab")
+        return old
+
+    def commit(self, seq: int):
+        """Delete every segment up to and including seq, once it's in the database."""
+        for old in self.segments():
+            if old <= seq:
+                os.remove(self.segment_path(old))
+
+    def replay(self) -> dict[int, tuple[int, int, int]]:
+        """Read every segment on disk. Returns the latest
+        (points, timestamp, action) for each user."""
+        self.sync()
+        latest = {}
+        for seq in self.segments():
+            with open(self.segment_path(seq), "rb") as f:
+                data = f.read()
+            # a crash can leave a partial record at the end
+            usable = len(data) - len(data) % RECORD.size
+            if usable != len(data):
+                logger.warning(f"Ignoring truncated record in journal segment {seq}.")
+            for user_id, points, timestamp, action in RECORD.iter_unpack(
+                data[:usable]
+            ):
+                latest[user_id] = (points, timestamp, action)
+        return latest
+
+    def close(self):
+        with self.lock:
+            self._seal(close=True)
+        self.sync()
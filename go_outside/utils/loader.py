@@ -0,0 +1,67 @@
+import asyncio
+import typing
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+Fetch = typing.Callable[[list[K]], typing.Awaitable[dict[K, V]]]
+
+
+class BatchLoader(typing.Generic[K, V]):
+    """Coalesces concurrent lookups into as few queries as possible.
+
+    Callers asking for a key that's already being fetched wait on the same
+    future instead of querying again. New keys are collected for `window`
+    seconds (or until `max_batch` are queued) and fetched with one call to
+    `fetch`, which returns {key: value} for the keys it found.
+    """
+
+    def __init__(self, fetch: Fetch, window: float, max_batch: int):
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max_batch
+        self._futures: dict[K, asyncio.Future] = {}  # queued or in flight
+        self._queued: list[K] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.queries = 0
+        self.coalesced = 0
+
+    async def load(self, key: K) -> V | None:
+        """Get the value for a key, or None if fetch didn't return one."""
+        future = self._futures.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            self._queued.append(key)
+            if len(self._queued) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch)
+        # a cancelled caller mustn't cancel the lookup for everyone else
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        keys, self._queued = self._queued, []
+        task = asyncio.create_task(self._run(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, keys: list[K]):
+        self.queries += 1
+        try:
+            found = await self.fetch(keys)
+        except Exception as e:
+            for key in keys:
+                future = self._futures.pop(key)
+                future.set_exception(e)
+                # don't warn about it if every caller was cancelled
+                future.exception()
+        else:
+            for key in keys:
+                self._futures.pop(key).set_result(found.get(key))
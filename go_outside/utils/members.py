@@ -0,0 +1,72 @@
+import disnake
+
+from go_outside.settings import Settings
+from go_outside.utils.cache import LRUCache
+
+# max user IDs per gateway member request
+QUERY_LIMIT = 100
+
+# Lean mode only: whether a user was in a guild when last queried, so repeated
+# lookups (e.g. every guild leaderboard) don't go back to the gateway. Entries
+# expire, so people who left drop off eventually.
+membership: LRUCache[tuple[int, int], bool] = LRUCache(
+    Settings.member_cache_size, ttl=Settings.member_cache_ttl
+)  # {(guild_id, user_id): is member}
+
+
+async def guild_member_ids(guild: disnake.Guild, user_ids: list[int]) -> set[int]:
+    """Which of user_ids are members of a guild.
+
+    Uses the member cache when it's fully populated. In lean mode the cache is
+    empty, so members are requested from the gateway in batches without being
+    cached, and the answers are remembered for a while.
+    """
+    found = {user_id for user_id in user_ids if guild.get_member(user_id)}
+    if not Settings.lean_mode:
+        return found
+    missing = []
+    for user_id in user_ids:
+        if user_id in found:
+            continue
+        known = membership.get((guild.id, user_id))
+        if known is None:
+            missing.append(user_id)
+        elif known:
+            found.add(user_id)
+    for i in range(0, len(missing), QUERY_LIMIT):
+        chunk = missing[i : i + QUERY_LIMIT]
+        members = await guild.query_members(
+            user_ids=chunk, limit=len(chunk), cache=False
+        )
+        ids = {member.id for member in members}
+        for user_id in chunk:
+            membership.set((guild.id, user_id), user_id in ids)
+        found |= ids
+    return found
+
+
+async def iter_member_ids(
+    guild: disnake.Guild, role: disnake.Role = None, chunk_size: int = 1000
+):
+    """Yield lists of up to chunk_size IDs of a guild's human members, or only
+    those with a role.
+
+    Uses the member cache if the guild is chunked. Otherwise members are paged
+    in over HTTP as they're consumed, without being cached.
+    """
+    if guild.chunked:
+        ids = [m.id for m in (role.members if role else guild.members) if not m.bot]
+        for i in range(0, len(ids), chunk_size):
+            yield ids[i : i + chunk_size]
+        return
+
+    chunk = []
+    async for member in guild.fetch_members(limit=None):
+        if member.bot or (role and not member.get_role(role.id)):
+            continue
+        chunk.append(member.id)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,178 @@
+"""Lightweight instrumentation. Metrics are created once at import/setup time,
+recording only bumps preallocated counters, so it's cheap enough for the hot path.
+Everything registered here can be rendered in Prometheus text format."""
+
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from loguru import logger
+
+# {(name, labels): metric}, re-registering a metric replaces it (e.g. on cog reload)
+registry: dict[tuple[str, str], "Metric"] = {}
+
+
+def _labels(labels: dict[str, str] | None) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Metric:
+    type = "untyped"
+    __slots__ = ("name", "help", "labels")
+
+    def __init__(self, name: str, help: str, labels: dict[str, str] = None):
+        self.name = name
+        self.help = help
+        self.labels = _labels(labels)
+        registry[(name, self.labels)] = self
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """(name suffix, labels, value) for each sample."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+    __slots__ = ("value",)
+
+    def __init__(self, name: str, help: str, labels: dict[str, str] = None):
+        super().__init__(name, help, labels)
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def samples(self):
+        return [("", self.labels, self.value)]
+
+
+class Gauge(Metric):
+    """A value read from a callback when metrics are collected."""
+
+    type = "gauge"
+    __slots__ = ("func",)
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        func: Callable[[], float],
+        labels: dict[str, str] = None,
+    ):
+        super().__init__(name, help, labels)
+        self.func = func
+
+    def samples(self):
+        return [("", self.labels, self.func())]
+
+
+class CounterFunc(Gauge):
+    """A counter read from a callback, for objects that already count things."""
+
+    type = "counter"
+    __slots__ = ()
+
+
+class Histogram(Metric):
+    type = "histogram"
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: list[float],
+        labels: dict[str, str] = None,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        # last slot is the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        result = []
+        base = self.labels[1:-1] + "," if self.labels else ""
+        total = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            total += count
+            result.append(("_bucket", "{" + base + f'le="{bound}"' + "}", total))
+        result.append(("_sum", self.labels, self.sum))
+        result.append(("_count", self.labels, self.count))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile (upper bound of the bucket it falls in)."""
+        target = self.count * q
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return float("inf")
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text format."""
+    lines = []
+    seen = set()
+    for (name, _), metric in sorted(registry.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+        for suffix, labels, value in metric.samples():
+            lines.append(f"{name}{suffix}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30]
+
+loop_lag = Histogram(
+    "go_outside_event_loop_lag_seconds",
+    "How late the event loop monitor woke up.",
+    LATENCY_BUCKETS,
+)
+
+
+async def monitor_loop_lag(interval: float = 1):
+    """Measure event loop lag by checking how late a sleep wakes up."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag.observe(time.perf_counter() - start - interval)
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        # we serve the same thing for every path, just drain the request headers
+        while (await reader.readline()).strip():
+            pass
+        body = render().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+            b"Connection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host: str, port: int) -> asyncio.Server:
+    """Serve metrics over HTTP for Prometheus to scrape."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,266 @@
+"""Central queue for outgoing messages.
+
+Messages are paced with sliding-window limits that mirror Discord's per-channel
+and global rate limits, so bursts wait in our queue instead of hitting 429s and
+sleeping inside the HTTP client while a command task is held up. Replies to
+commands always go before notifications, and pending notifications for the
+same channel are merged into as few messages as possible. Notifications also
+leave part of each channel's limit free, so a reply never waits behind them.
+
+Sending goes through a pluggable `sender(channel_id, content, kwargs)`
+coroutine, so the scheduler can be driven against a fake HTTP layer.
+"""
+
+import asyncio
+import heapq
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+
+from go_outside.settings import Settings
+from go_outside.utils import metrics
+from go_outside.utils.cache import LRUCache
+
+Sender = Callable[[int, str | None, dict], Awaitable[Any]]
+
+REPLY = 0
+NOTIFICATION = 1
+
+
+class RateLimit:
+    """Allows at most `rate` events in any `per` seconds."""
+
+    __slots__ = ("rate", "per", "times")
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.times: deque[float] = deque(maxlen=rate)
+
+    def delay(self, now: float, reserve: int = 0) -> float:
+        """Seconds until an event is allowed, leaving `reserve` events of the
+        window unused. 0 if one is allowed now."""
+        allowed = self.rate - reserve
+        if len(self.times) < allowed:
+            return 0
+        return max(0.0, self.times[-allowed] + self.per - now)
+
+    def take(self, now: float):
+        self.times.append(now)
+
+
+class ChannelQueue:
+    __slots__ = ("replies", "notifications")
+
+    def __init__(self):
+        # (content, kwargs, future)
+        self.replies: deque[tuple[str | None, dict, asyncio.Future]] = deque()
+        self.notifications: list[str] = []
+
+
+class MessageScheduler:
+    def __init__(self, sender: Sender):
+        self.sender = sender
+        # channels with something queued
+        self.channels: dict[int, ChannelQueue] = {}
+        # channels that may be under their limit, per priority, oldest first
+        self.ready: dict[int, dict[int, None]] = {REPLY: {}, NOTIFICATION: {}}
+        # channels waiting for their limit to free up, as a heap of
+        # (time, channel_id). Entries that don't match parked_at are stale.
+        self.parked: list[tuple[float, int]] = []
+        self.parked_at: dict[int, float] = {}
+        # a limit is clear again one period after it was last used, so it can expire
+        self.limits: LRUCache[int, RateLimit] = LRUCache(
+            Settings.Outbound.limit_cache_size, ttl=Settings.Outbound.channel_period
+        )
+        self.global_limit = RateLimit(Settings.Outbound.global_messages, 1)
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.sends: set[asyncio.Task] = set()
+
+        self.sent = {
+            priority: metrics.Counter(
+                "go_outside_outbound_sent_total",
+                "Messages sent through the outbound queue.",
+                {"priority": name},
+            )
+            for priority, name in ((REPLY, "reply"), (NOTIFICATION, "notification"))
+        }
+        self.merged = metrics.Counter(
+            "go_outside_outbound_merged_total",
+            "Notifications merged into another message.",
+        )
+        metrics.Gauge(
+            "go_outside_outbound_waiting",
+            "Channels with queued messages.",
+            self.channels.__len__,
+        )
+
+    def start(self):
+        self.task = asyncio.create_task(self.dispatch())
+
+    async def close(self):
+        """Stop sending. Replies still queued are cancelled, notifications dropped."""
+        if self.task:
+            self.task.cancel()
+        for queue in self.channels.values():
+            for _, _, future in queue.replies:
+                future.cancel()
+        self.channels.clear()
+        for ready in self.ready.values():
+            ready.clear()
+        self.parked.clear()
+        self.parked_at.clear()
+        if self.sends:
+            await asyncio.wait(self.sends, timeout=5)
+
+    def _queue(self, channel_id: int) -> ChannelQueue:
+        queue = self.channels.get(channel_id)
+        if queue is None:
+            queue = self.channels[channel_id] = ChannelQueue()
+        self.wakeup.set()
+        return queue
+
+    def _limit(self, channel_id: int) -> RateLimit:
+        limit = self.limits.get(channel_id, count=False)
+        if limit is None:
+            limit = RateLimit(
+                Settings.Outbound.channel_messages, Settings.Outbound.channel_period
+            )
+        return limit
+
+    async def send(self, channel_id: int, content: str = None, **kwargs):
+        """Send a reply ahead of any notifications, and return the sent message."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queue(channel_id)
+        if not queue.replies:
+            # notifications leave part of the limit free, so a reply may be
+            # allowed now even if the channel was waiting
+            self.ready[NOTIFICATION].pop(channel_id, None)
+            self.parked_at.pop(channel_id, None)
+            self.ready[REPLY][channel_id] = None
+        queue.replies.append((content, kwargs, future))
+        return await future
+
+    def notify(self, channel_id: int, content: str):
+        """Queue a notification. It may be merged with others for the same channel."""
+        queue = self._queue(channel_id)
+        if not (queue.replies or queue.notifications):
+            self.ready[NOTIFICATION][channel_id] = None
+        queue.notifications.append(content)
+
+    def _park(self, channel_id: int, until: float):
+        self.parked_at[channel_id] = until
+        heapq.heappush(self.parked, (until, channel_id))
+
+    def _unpark(self, now: float):
+        """Make channels whose limit has freed up ready again."""
+        while self.parked and self.parked[0][0] <= now:
+            until, channel_id = heapq.heappop(self.parked)
+            if self.parked_at.get(channel_id) != until:
+                continue
+            del self.parked_at[channel_id]
+            queue = self.channels[channel_id]
+            self.ready[REPLY if queue.replies else NOTIFICATION][channel_id] = None
+
+    def _next(self, now: float) -> tuple[int | None, float]:
+        """Pick the channel to send to next: the oldest one with a reply, otherwise
+        the oldest one with notifications, among channels that are under their limit.
+        Channels found over their limit are parked until it frees up, so each
+        pick only looks at a few channels however many are waiting.
+        Returns (channel_id or None, seconds until one might be ready)."""
+        self._unpark(now)
+        for priority in (REPLY, NOTIFICATION):
+            ready = self.ready[priority]
+            reserve = Settings.Outbound.reply_reserve if priority == NOTIFICATION else 0
+            while ready:
+                channel_id = next(iter(ready))
+                delay = self._limit(channel_id).delay(now, reserve)
+                if not delay:
+                    return channel_id, 0
+                del ready[channel_id]
+                self._park(channel_id, now + delay)
+        if self.parked:
+            return None, self.parked[0][0] - now
+        return None, Settings.Outbound.channel_period
+
+    def _merge(self, notifications: list[str]) -> str:
+        """Pop as many notifications as fit in one message."""
+        limit = Settings.Outbound.max_length
+        parts = [notifications[0]]
+        length = len(parts[0])
+        for content in notifications[1:]:
+            if length + 1 + len(content) > limit:
+                break
+            parts.append(content)
+            length += 1 + len(content)
+        del notifications[: len(parts)]
+        self.merged.inc(len(parts) - 1)
+        return "\n".join(parts)
+
+    async def dispatch(self):
+        while True:
+            if not self.channels:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            now = time.monotonic()
+            channel_id, wait = self._next(now)
+            if channel_id is None:
+                # sleep until a limit frees up, or new work comes in
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self.global_limit.delay(now)
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            self.global_limit.take(now)
+
+            limit = self._limit(channel_id)
+            limit.take(now)
+            self.limits.set(channel_id, limit)
+            queue = self.channels[channel_id]
+            if queue.replies:
+                content, kwargs, future = queue.replies.popleft()
+                priority = REPLY
+            else:
+                content, kwargs, future = self._merge(queue.notifications), {}, None
+                priority = NOTIFICATION
+            if not (queue.replies or queue.notifications):
+                # goes to the back of the line if anything else is queued later
+                del self.channels[channel_id]
+                del self.ready[priority][channel_id]
+            elif priority == REPLY and not queue.replies:
+                del self.ready[REPLY][channel_id]
+                self.ready[NOTIFICATION][channel_id] = None
+            self.sent[priority].inc()
+
+            task = asyncio.create_task(self._send(channel_id, content, kwargs, future))
+            self.sends.add(task)
+            task.add_done_callback(self.sends.discard)
+
+    async def _send(
+        self,
+        channel_id: int,
+        content: str | None,
+        kwargs: dict,
+        future: asyncio.Future | None,
+    ):
+        try:
+            result = await self.sender(channel_id, content, kwargs)
+        except Exception as e:
+            if future is None:
+                logger.warning(f"Failed to send notification to {channel_id}: {e}")
+            elif not future.done():
+                future.set_exception(e)
+        else:
+            if future is not None and not future.done():
+                future.set_result(result)
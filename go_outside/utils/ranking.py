@@ -0,0 +1,121 @@
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator
+
+_ID_BITS = 64
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+def _key(user_id: int, points: int) -> int:
+    # sorts by points descending, then user_id ascending
+    return (-points << _ID_BITS) | user_id
+
+
+def _unkey(key: int) -> tuple[int, int]:
+    return key & _ID_MASK, -(key >> _ID_BITS)
+
+
+class RankIndex:
+    """Users ordered by points, highest first.
+
+    Keys are packed into single ints and kept in a list of sorted buckets,
+    so inserts/removes only shift one bucket and finding a user's position
+    only sums bucket lengths.
+    """
+
+    bucket_size = 1000
+
+    def __init__(self):
+        self._buckets: list[list[int]] = []
+        self._maxes: list[int] = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def rebuild(self, rows: Iterable[tuple[int, int]]):
+        """Replace the index contents with (user_id, points) rows."""
+        keys = sorted(_key(user_id, points) for user_id, points in rows)
+        size = self.bucket_size
+        self._buckets = [keys[i : i + size] for i in range(0, len(keys), size)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._len = len(keys)
+
+    def add(self, user_id: int, points: int):
+        key = _key(user_id, points)
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            return
+
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._buckets[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._buckets[i], key)
+        self._len += 1
+
+        bucket = self._buckets[i]
+        if len(bucket) > 2 * self.bucket_size:
+            half = len(bucket) // 2
+            self._buckets[i : i + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[i : i + 1] = [bucket[half - 1], bucket[-1]]
+
+    def remove(self, user_id: int, points: int) -> bool:
+        key = _key(user_id, points)
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return False
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            return False
+
+        del bucket[j]
+        self._len -= 1
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+        return True
+
+    def discard(self, user_id: int) -> bool:
+        """Remove a user whose points aren't known. This scans the whole index."""
+        for bucket in self._buckets:
+            for key in bucket:
+                if key & _ID_MASK == user_id:
+                    return self.remove(*_unkey(key))
+        return False
+
+    def update(self, user_id: int, old_points: int, new_points: int):
+        self.remove(user_id, old_points)
+        self.add(user_id, new_points)
+
+    def position(self, user_id: int, points: int) -> int | None:
+        """1-based rank of a user, or None if they aren't in the index."""
+        key = _key(user_id, points)
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return None
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, key)
+        if j == len(bucket) or bucket[j] != key:
+            return None
+        return sum(len(b) for b in self._buckets[:i]) + j + 1
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        """Iterate (user_id, points) from the top."""
+        for bucket in self._buckets:
+            for key in bucket:
+                yield _unkey(key)
+
+    def top(self, count: int) -> list[tuple[int, int]]:
+        result = []
+        for row in self:
+            if len(result) >= count:
+                break
+            result.append(row)
+        return result
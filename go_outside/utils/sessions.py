@@ -0,0 +1,146 @@
+"""Incremental inactivity session tracking.
+
+A session is the gap between two actions by a user. Summaries are updated as
+sessions come in, so stats can be read without scanning any history.
+"""
+
+import datetime
+from array import array
+
+from go_outside.settings import Settings
+from go_outside.utils.format import DAY
+
+_MAX = 2**32 - 1
+
+
+def _period(timestamp: int) -> tuple[int, int, int]:
+    """(day, week, month) numbers for a unix timestamp, in UTC.
+    Weeks start on Monday, months are counted as year * 12 + month."""
+    day = timestamp // DAY
+    # 1970-01-01 was a Thursday
+    week = (day + 3) // 7
+    date = datetime.date.fromordinal(day + 719163)
+    return day, week, date.year * 12 + date.month - 1
+
+
+class SessionStats:
+    """Session summaries for a single user, stored as packed arrays."""
+
+    __slots__ = (
+        "user_id",
+        "streak",
+        "streak_day",
+        "recent",
+        "recent_pos",
+        "day",
+        "days",
+        "week",
+        "week_total",
+        "week_longest",
+        "month",
+        "month_total",
+        "month_longest",
+    )
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        # consecutive days with a long enough session, ending on streak_day
+        self.streak = 0
+        self.streak_day = 0
+        # ring buffer of the most recent session lengths
+        self.recent = array("I", bytes(4 * Settings.Leveling.session_history))
+        self.recent_pos = 0
+        # ring buffer of daily totals, indexed by day number, newest is self.day
+        self.day = 0
+        self.days = array("I", bytes(4 * Settings.Leveling.session_days))
+        self.week = 0
+        self.week_total = 0
+        self.week_longest = 0
+        self.month = 0
+        self.month_total = 0
+        self.month_longest = 0
+
+    columns = __slots__
+
+    @classmethod
+    def from_row(cls, row: dict) -> "SessionStats":
+        stats = cls(row["user_id"])
+        for column in cls.columns:
+            value = row[column]
+            if column in ("recent", "days"):
+                # keep the configured size even if the setting changed
+                packed = array("I")
+                packed.frombytes(value)
+                getattr(stats, column)[: len(packed)] = packed[
+                    : len(getattr(stats, column))
+                ]
+            else:
+                setattr(stats, column, value)
+        return stats
+
+    def to_dict(self) -> dict:
+        row = {column: getattr(self, column) for column in self.columns}
+        row["recent"] = self.recent.tobytes()
+        row["days"] = self.days.tobytes()
+        return row
+
+    def record(self, length: int, end: int):
+        """Add a session of `length` seconds that ended at unix time `end`."""
+        capped = min(length, _MAX)
+        day, week, month = _period(end)
+
+        self.recent[self.recent_pos] = capped
+        self.recent_pos = (self.recent_pos + 1) % len(self.recent)
+
+        if day > self.day:
+            # clear the slots for any days we skipped
+            for skipped in range(self.day + 1, min(day, self.day + len(self.days)) + 1):
+                self.days[skipped % len(self.days)] = 0
+            self.day = day
+        if day > self.day - len(self.days):
+            slot = day % len(self.days)
+            self.days[slot] = min(self.days[slot] + capped, _MAX)
+
+        if week != self.week:
+            self.week, self.week_total, self.week_longest = week, 0, 0
+        self.week_total += length
+        self.week_longest = max(self.week_longest, length)
+
+        if month != self.month:
+            self.month, self.month_total, self.month_longest = month, 0, 0
+        self.month_total += length
+        self.month_longest = max(self.month_longest, length)
+
+        if length >= Settings.Leveling.streak_session:
+            if day == self.streak_day + 1:
+                self.streak += 1
+            elif day != self.streak_day:
+                self.streak = 1
+            self.streak_day = day
+
+    def current_streak(self, now: int) -> int:
+        """Streak length, or 0 if it was broken before today/yesterday."""
+        return self.streak if now // DAY - self.streak_day <= 1 else 0
+
+    def this_week(self, now: int) -> tuple[int, int]:
+        """(total, longest) session seconds this week."""
+        _, week, _ = _period(now)
+        return (self.week_total, self.week_longest) if week == self.week else (0, 0)
+
+    def this_month(self, now: int) -> tuple[int, int]:
+        """(total, longest) session seconds this month."""
+        _, _, month = _period(now)
+        if month == self.month:
+            return self.month_total, self.month_longest
+        return 0, 0
+
+    def today(self, now: int) -> int:
+        """Total session seconds today."""
+        day = now // DAY
+        return self.days[day % len(self.days)] if day == self.day else 0
+
+    def recent_sessions(self) -> list[int]:
+        """Most recent session lengths, newest first."""
+        size = len(self.recent)
+        ordered = [self.recent[(self.recent_pos - i) % size] for i in range(1, size + 1)]
+        return [length for length in ordered if length]
@@ -0,0 +1,79 @@
+"""Compact in-memory user state, used on the hot path instead of ORM objects."""
+
+# Action types are stored as small ints. Only append to this, never reorder.
+ACTIONS: list[str] = [
+    "message_create",
+    "message_edit",
+    "message_delete",
+    "reaction_add",
+    "reaction_remove",
+    "typing",
+    "voice_state_update",
+    "presence_update",
+]
+ACTION_IDS: dict[str, int] = {action: i for i, action in enumerate(ACTIONS)}
+
+
+def action_id(action: str) -> int:
+    """Get the id for an action type, interning it if it's new."""
+    try:
+        return ACTION_IDS[action]
+    except KeyError:
+        ACTION_IDS[action] = len(ACTIONS)
+        ACTIONS.append(action)
+        return ACTION_IDS[action]
+
+
+class UserState:
+    """Points and last action for a single registered user."""
+
+    __slots__ = (
+        "user_id",
+        "points",
+        "last_action_timestamp",
+        "last_action_type",
+        "personal_best",
+    )
+
+    # column order used by from_row, matches the User table
+    columns = (
+        "user_id",
+        "points",
+        "last_action_timestamp",
+        "last_action_type",
+        "personal_best",
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        points: int,
+        last_action_timestamp: int,
+        last_action_type: int,
+        personal_best: int,
+    ):
+        self.user_id = user_id
+        self.points = points
+        self.last_action_timestamp = last_action_timestamp
+        self.last_action_type = last_action_type
+        self.personal_best = personal_best
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "UserState":
+        """Build from a (user_id, points, timestamp, action name, personal_best) row."""
+        user_id, points, timestamp, action, personal_best = row
+        return cls(user_id, points, timestamp, action_id(action), personal_best)
+
+    @property
+    def last_action(self) -> str:
+        return ACTIONS[self.last_action_type]
+
+    def to_dict(self) -> dict:
+        """Column values as stored in the User table."""
+        return {
+            "user_id": self.user_id,
+            "points": self.points,
+            "last_action_timestamp": self.last_action_timestamp,
+            "last_action_type": self.last_action,
+            "personal_best": self.personal_best,
+        }
@@ -0,0 +1,65 @@
+_ID_BITS = 64
+_ID_MASK = (1 << _ID_BITS) - 1
+
+# Slot width of each level is 2**shift seconds: 1s, ~1m, ~68m, ~73h.
+# Slots are keyed by absolute slot number, so the last level has no horizon.
+SHIFTS = (0, 6, 12, 18)
+
+
+class TimerWheel:
+    """Hierarchical timer wheel with one-second resolution.
+
+    A timer goes in the finest level whose slot width covers the gap to its due
+    time, and is moved down a level each time its slot comes up, so adding a
+    timer is O(1) and advancing only touches timers that are (nearly) due.
+    Timers are packed into single ints, (due << 64) | key, to keep a million of
+    them cheap. There's no cancel, callers check for stale timers when they fire.
+    """
+
+    def __init__(self, now: int):
+        self.now = now
+        self.levels: list[dict[int, list[int]]] = [{} for _ in SHIFTS]
+        self.expired: list[int] = []  # due at or before now
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key: int, due: int):
+        """Schedule `key` to fire at unix time `due`."""
+        self._len += 1
+        self._place((due << _ID_BITS) | key, due)
+
+    def _place(self, timer: int, due: int):
+        if due <= self.now:
+            self.expired.append(timer)
+            return
+        level = 0
+        while (
+            level < len(SHIFTS) - 1
+            and due >> SHIFTS[level + 1] != self.now >> SHIFTS[level + 1]
+        ):
+            level += 1
+        slot = due >> SHIFTS[level]
+        timers = self.levels[level].get(slot)
+        if timers is None:
+            self.levels[level][slot] = [timer]
+        else:
+            timers.append(timer)
+
+    def advance(self, now: int) -> list[tuple[int, int]]:
+        """Move time forward and return (key, due) for every timer that's due."""
+        while self.now < now:
+            self.now += 1
+            # cascade slots that start now, coarsest first
+            for level in range(len(SHIFTS) - 1, 0, -1):
+                shift = SHIFTS[level]
+                if self.now & ((1 << shift) - 1):
+                    continue
+                for timer in self.levels[level].pop(self.now >> shift, ()):
+                    self._place(timer, timer >> _ID_BITS)
+            self.expired.extend(self.levels[0].pop(self.now, ()))
+
+        fired, self.expired = self.expired, []
+        self._len -= len(fired)
+        return [(timer & _ID_MASK, timer >> _ID_BITS) for timer in fired]
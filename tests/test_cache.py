@@ -0,0 +1,32 @@
+import unittest
+
+from go_outside.utils.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+        self.assertEqual(sorted(cache._data), [1, 3])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_pinned_entries_are_kept_then_evicted(self):
+        pinned = set(range(100))
+        cache = LRUCache(50, pinned=lambda key: key in pinned)
+        for key in range(100):
+            cache.set(key, key)
+        self.assertEqual(len(cache), 100)
+
+        # once unpinned, the excess goes over the next few sets
+        pinned.clear()
+        for key in range(100, 110):
+            cache.set(key, key)
+        self.assertEqual(len(cache), 50)
+        self.assertIn(109, cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
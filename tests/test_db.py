@@ -0,0 +1,67 @@
+import unittest
+from contextlib import asynccontextmanager
+
+from go_outside.utils import db
+from go_outside.utils.state import UserState
+
+
+class FakeConnection:
+    """Records the statements and COPYs an asyncpg connection would run."""
+
+    def __init__(self):
+        self.statements: list[str] = []
+        self.copies: list[tuple[str, list[str], list[tuple]]] = []
+
+    @asynccontextmanager
+    async def acquire_connection(self):
+        yield self
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query: str):
+        self.statements.append(query)
+
+    async def copy_records_to_table(self, table: str, records: list, columns: list):
+        self.copies.append((table, columns, records))
+
+
+class CopyUpdateUsersTest(unittest.IsolatedAsyncioTestCase):
+    users = [UserState(1, 10, 100, 2, 50), UserState(2, 20, 200, 3, 60)]
+
+    async def test_update(self):
+        conn = FakeConnection()
+        await db.copy_update_users(conn, self.users, {"points", "last_action_type"})
+
+        table, columns, records = conn.copies[0]
+        self.assertEqual(table, "user_flush")
+        self.assertEqual(columns, ["user_id", "last_action_type", "points"])
+        self.assertEqual(
+            records, [(1, "message_delete", 10), (2, "reaction_add", 20)]
+        )
+        create, update = conn.statements
+        self.assertIn("SELECT user_id, last_action_type, points FROM", create)
+        self.assertIn(
+            "SET last_action_type = f.last_action_type, points = f.points", update
+        )
+
+    async def test_upsert_with_every_column(self):
+        # an import passes every column, user_id must still only appear once
+        conn = FakeConnection()
+        await db.copy_update_users(
+            conn, self.users, set(UserState.columns), upsert=True
+        )
+
+        _, columns, records = conn.copies[0]
+        self.assertEqual(columns.count("user_id"), 1)
+        self.assertEqual(sorted(columns), sorted(UserState.columns))
+        self.assertEqual(len(records[0]), len(UserState.columns))
+        create, insert = conn.statements
+        self.assertEqual(create.count("user_id"), 1)
+        self.assertIn("ON CONFLICT (user_id) DO UPDATE SET", insert)
+        self.assertNotIn("user_id = EXCLUDED.user_id", insert)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from go_outside.utils.journal import Journal
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "journal")
+
+    def test_replay_after_rotate_and_commit(self):
+        journal = Journal(self.path)
+        journal.append(1, 10, 100, 0)
+        old = journal.rotate()
+        journal.append(2, 20, 200, 1)
+        journal.sync()
+        journal.commit(old)
+        journal.close()
+
+        self.assertEqual(Journal(self.path).replay(), {2: (20, 200, 1)})
+
+    def test_sync_in_thread_keeps_order(self):
+        journal = Journal(self.path)
+        stop = threading.Event()
+
+        def syncer():
+            while not stop.is_set():
+                journal.sync()
+
+        thread = threading.Thread(target=syncer)
+        thread.start()
+        for i in range(20_000):
+            journal.append(i % 100, i, i, 0)
+            if i % 5000 == 0:
+                journal.rotate()
+        stop.set()
+        thread.join()
+        journal.close()
+
+        latest = Journal(self.path).replay()
+        self.assertEqual(len(latest), 100)
+        self.assertEqual(latest[99], (19_999, 19_999, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
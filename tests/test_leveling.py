@@ -0,0 +1,59 @@
+import random
+import unittest
+from unittest import mock
+
+from go_outside.cogs.leveling import Leveling, calculate_points
+from go_outside.settings import Settings
+from go_outside.utils.events import Event
+
+
+class CoalesceTest(unittest.TestCase):
+    def setUp(self):
+        self.cog = Leveling.__new__(Leveling)
+
+    @mock.patch.object(Settings.Leveling, "points_scaling", 7)
+    def test_matches_scoring_every_event(self):
+        rng = random.Random(3)
+        min_session = Settings.Leveling.min_session
+        for _ in range(100):
+            last_action = rng.randrange(10**6)
+            timestamps = [last_action + rng.randrange(1000)]
+            for _ in range(rng.randrange(1, 30)):
+                timestamps.append(timestamps[-1] + rng.choice([0, 1, 30, 500, 5000]))
+
+            pending = {}
+            for i, timestamp in enumerate(timestamps):
+                self.cog.coalesce(pending, Event(1, i % 3, timestamp))
+            first, last, action, points_between, gaps = pending[1]
+
+            # what scoring each event as it came in would have given
+            points = 0
+            sessions = []
+            previous = first
+            for timestamp in timestamps[1:]:
+                points += calculate_points(timestamp - previous)
+                if timestamp - previous >= min_session:
+                    sessions.append((timestamp - previous, timestamp))
+                previous = timestamp
+            self.assertEqual((first, last), (timestamps[0], timestamps[-1]))
+            self.assertEqual(action, (len(timestamps) - 1) % 3)
+            self.assertEqual(points_between, points)
+            self.assertEqual(gaps or [], sessions)
+            self.assertEqual(
+                calculate_points(first - last_action) + points_between,
+                sum(
+                    calculate_points(b - a)
+                    for a, b in zip([last_action, *timestamps], timestamps)
+                ),
+            )
+
+    def test_drops_older_events(self):
+        pending = {}
+        self.cog.coalesce(pending, Event(1, 0, 1000))
+        self.cog.coalesce(pending, Event(1, 1, 400))
+        self.assertEqual(pending[1], [1000, 1000, 0, 0, None])
+        self.assertEqual(calculate_points(-600), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
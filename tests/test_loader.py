@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+
+from go_outside.utils.loader import BatchLoader
+
+
+class BatchLoaderTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls: list[list[int]] = []
+
+    async def fetch(self, keys: list[int]) -> dict[int, str]:
+        self.calls.append(keys)
+        await asyncio.sleep(0.01)
+        return {key: str(key) for key in keys if key % 2 == 0}
+
+    async def test_batches_and_deduplicates(self):
+        loader = BatchLoader(self.fetch, window=0.01, max_batch=100)
+        results = await asyncio.gather(*(loader.load(key) for key in [1, 2, 2, 3, 4]))
+
+        self.assertEqual(results, [None, "2", "2", None, "4"])
+        self.assertEqual(self.calls, [[1, 2, 3, 4]])
+        self.assertEqual((loader.queries, loader.coalesced), (1, 1))
+
+    async def test_joins_a_lookup_in_flight(self):
+        loader = BatchLoader(self.fetch, window=0.001, max_batch=100)
+        first = asyncio.create_task(loader.load(2))
+        await asyncio.sleep(0.005)  # dispatched, fetch still running
+        self.assertEqual(await asyncio.gather(first, loader.load(2)), ["2", "2"])
+        self.assertEqual(self.calls, [[2]])
+
+    async def test_max_batch_dispatches_early(self):
+        loader = BatchLoader(self.fetch, window=10, max_batch=3)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(loader.load(key) for key in range(6))), 1
+        )
+        self.assertEqual(results, ["0", None, "2", None, "4", None])
+        self.assertEqual(self.calls, [[0, 1, 2], [3, 4, 5]])
+
+    async def test_errors_reach_every_caller(self):
+        async def fail(keys):
+            raise RuntimeError("down")
+
+        loader = BatchLoader(fail, window=0.001, max_batch=100)
+        results = await asyncio.gather(
+            loader.load(1), loader.load(1), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        # nothing is left behind, the next lookup queries again
+        self.assertEqual(loader._futures, {})
+
+    async def test_cancelled_caller_doesnt_cancel_others(self):
+        loader = BatchLoader(self.fetch, window=0.001, max_batch=100)
+        cancelled = asyncio.create_task(loader.load(2))
+        other = asyncio.create_task(loader.load(2))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        self.assertEqual(await other, "2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import random
+import unittest
+
+from go_outside.utils.ranking import RankIndex
+
+
+class RankIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = RankIndex()
+        self.index.bucket_size = 4
+
+    def expected(self, points: dict[int, int]) -> list[tuple[int, int]]:
+        return sorted(points.items(), key=lambda row: (-row[1], row[0]))
+
+    def test_add_splits_buckets_and_keeps_order(self):
+        rng = random.Random(1)
+        points = {user_id: rng.randrange(50) for user_id in range(1, 101)}
+        for user_id, user_points in points.items():
+            self.index.add(user_id, user_points)
+
+        self.assertGreater(len(self.index._buckets), 1)
+        self.assertEqual(list(self.index), self.expected(points))
+        self.assertEqual(len(self.index), 100)
+
+    def test_position_across_buckets(self):
+        points = {user_id: user_id * 10 for user_id in range(1, 41)}
+        for user_id, user_points in points.items():
+            self.index.add(user_id, user_points)
+
+        for position, (user_id, user_points) in enumerate(self.expected(points), 1):
+            self.assertEqual(self.index.position(user_id, user_points), position)
+        self.assertIsNone(self.index.position(1, 11))
+        self.assertIsNone(self.index.position(99, 0))
+
+    def test_remove_empties_buckets(self):
+        self.index.rebuild((user_id, user_id) for user_id in range(1, 21))
+        for user_id in range(1, 21, 2):
+            self.assertTrue(self.index.remove(user_id, user_id))
+        self.assertFalse(self.index.remove(1, 1))
+        # a whole bucket's worth of the top users
+        for user_id in (20, 18, 16, 14):
+            self.assertTrue(self.index.remove(user_id, user_id))
+
+        self.assertEqual(
+            list(self.index), [(12, 12), (10, 10), (8, 8), (6, 6), (4, 4), (2, 2)]
+        )
+        self.assertEqual(self.index.position(2, 2), 6)
+
+    def test_update_and_discard(self):
+        self.index.rebuild((user_id, 0) for user_id in range(1, 11))
+        self.index.update(7, 0, 100)
+        self.assertEqual(self.index.top(2), [(7, 100), (1, 0)])
+
+        self.assertTrue(self.index.discard(7))
+        self.assertFalse(self.index.discard(7))
+        self.assertEqual(len(self.index), 9)
+        self.assertIsNone(self.index.position(7, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
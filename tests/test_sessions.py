@@ -0,0 +1,75 @@
+import unittest
+
+from go_outside.settings import Settings
+from go_outside.utils.format import DAY
+from go_outside.utils.sessions import SessionStats
+
+# 2024-01-01, a Monday
+MONDAY = 1_704_067_200
+
+
+class SessionStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = SessionStats(1)
+
+    def test_day_ring(self):
+        self.stats.record(100, MONDAY + 10)
+        self.stats.record(50, MONDAY + 20)
+        self.stats.record(30, MONDAY + DAY)
+        self.assertEqual(self.stats.today(MONDAY + DAY), 30)
+        self.assertEqual(self.stats.today(MONDAY + 2 * DAY), 0)
+
+        # a gap longer than the ring clears every old slot
+        later = MONDAY + (Settings.Leveling.session_days + 3) * DAY
+        self.stats.record(7, later)
+        self.assertEqual(self.stats.today(later), 7)
+        self.assertEqual(sum(self.stats.days), 7)
+
+    def test_recent_ring(self):
+        size = Settings.Leveling.session_history
+        for length in range(1, size + 3):
+            self.stats.record(length, MONDAY + length)
+        self.assertEqual(self.stats.recent_sessions(), list(range(size + 2, 2, -1)))
+
+    def test_week_rollover(self):
+        sunday = MONDAY + 6 * DAY
+        self.stats.record(100, MONDAY)
+        self.stats.record(300, sunday)
+        self.assertEqual(self.stats.this_week(sunday), (400, 300))
+
+        self.stats.record(50, sunday + DAY)
+        self.assertEqual(self.stats.this_week(sunday + DAY), (50, 50))
+        self.assertEqual(self.stats.this_week(sunday + 8 * DAY), (0, 0))
+
+    def test_month_rollover(self):
+        january_31 = MONDAY + 30 * DAY
+        self.stats.record(100, MONDAY)
+        self.stats.record(200, january_31)
+        self.assertEqual(self.stats.this_month(january_31), (300, 200))
+
+        self.stats.record(20, january_31 + DAY)
+        self.assertEqual(self.stats.this_month(january_31 + DAY), (20, 20))
+        # any other month reads as empty
+        self.assertEqual(self.stats.this_month(MONDAY), (0, 0))
+
+    def test_streak(self):
+        long = Settings.Leveling.streak_session
+        for day in range(3):
+            self.stats.record(long, MONDAY + day * DAY)
+        # short sessions and a second long one on the same day don't count
+        self.stats.record(long - 1, MONDAY + 3 * DAY)
+        self.stats.record(long, MONDAY + 2 * DAY + 60)
+        self.assertEqual(self.stats.current_streak(MONDAY + 3 * DAY), 3)
+        self.assertEqual(self.stats.current_streak(MONDAY + 4 * DAY), 0)
+
+        self.stats.record(long, MONDAY + 5 * DAY)
+        self.assertEqual(self.stats.current_streak(MONDAY + 5 * DAY), 1)
+
+    def test_row_round_trip(self):
+        self.stats.record(100, MONDAY)
+        copy = SessionStats.from_row(self.stats.to_dict())
+        self.assertEqual(copy.to_dict(), self.stats.to_dict())
+
+
+if __name__ == "__main__":
+    unittest.main()
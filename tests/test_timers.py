@@ -0,0 +1,71 @@
+import random
+import unittest
+from unittest import mock
+
+from go_outside.cogs.leveling import calculate_level, next_milestone, projected_points
+from go_outside.settings import Settings
+from go_outside.utils.timers import TimerWheel
+
+START = 1_700_000_000
+
+
+class TimerWheelTest(unittest.TestCase):
+    def test_fires_on_the_due_second(self):
+        rng = random.Random(1)
+        wheel = TimerWheel(START)
+        # spread over every level, the coarsest slots are ~73h wide
+        timers = {key: START + rng.randrange(-5, 4 * 86400) for key in range(2000)}
+        for key, due in timers.items():
+            wheel.add(key, due)
+
+        fired = {}
+        for now in range(START, START + 4 * 86400 + 1):
+            for key, due in wheel.advance(now):
+                self.assertEqual(due, timers[key])
+                self.assertEqual(now, max(due, START))
+                fired[key] = due
+        self.assertEqual(fired, timers)
+        self.assertEqual(len(wheel), 0)
+
+    def test_jumps_fire_everything_due(self):
+        wheel = TimerWheel(START)
+        wheel.add(1, START + 10)
+        wheel.add(2, START + 5000)
+        wheel.add(3, START + 10**6)
+        self.assertEqual(
+            wheel.advance(START + 6000), [(1, START + 10), (2, START + 5000)]
+        )
+        self.assertEqual(len(wheel), 1)
+        # added behind the wheel's time, fires on the next advance
+        wheel.add(4, START)
+        self.assertEqual(wheel.advance(START + 6000), [(4, START)])
+
+
+def brute_force_milestone(points: int, last_action: int, now: int) -> int:
+    step = Settings.Leveling.level_notification_step
+    start = calculate_level(projected_points(points, last_action, now)) // step
+    t = now + 1
+    while True:
+        level = calculate_level(projected_points(points, last_action, t))
+        if level // step > start or t - last_action in Settings.Leveling.milestones:
+            return t
+        t += 1
+
+
+class NextMilestoneTest(unittest.TestCase):
+    @mock.patch.object(Settings.Leveling, "points_scaling", 1)
+    def test_matches_brute_force(self):
+        rng = random.Random(2)
+        for _ in range(200):
+            points = rng.choice([0, rng.randrange(10**4), rng.randrange(10**9)])
+            last_action = START - rng.randrange(2 * 86400)
+            now = rng.randrange(last_action, START + 1)
+            self.assertEqual(
+                next_milestone(points, last_action, now),
+                brute_force_milestone(points, last_action, now),
+                (points, last_action, now),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()